@@ -0,0 +1,72 @@
+"""Bytes on the wire and CPU per response: identity vs. gzip / brotli levels vs. a cached compressed body.
+
+Builds a page shaped like /data/{table}/all for tracking (items with their activity) so it runs without a
+database. The cached row is what a response cache hit costs: a dict lookup of the stored variant.
+
+    python -m benchmarks.bench_compression [--items 500] [--iterations 200]
+"""
+
+import argparse
+import json
+import time
+import uuid
+from datetime import UTC, datetime, timedelta
+
+from src.services.compression import CachedBody, Compressor
+
+
+def page(items: int) -> bytes:
+    activities = [{"id": str(uuid.uuid4()), "name": f"activity {i}", "points": 10 * i} for i in range(20)]
+    now = datetime.now(UTC)
+    return json.dumps(
+        {
+            "items": [
+                {
+                    "id": str(uuid.uuid4()),
+                    "user_id": str(uuid.uuid4()),
+                    "activity_id": activities[i % 20]["id"],
+                    "added_at": (now - timedelta(minutes=i)).isoformat(),
+                    "activity": activities[i % 20],
+                }
+                for i in range(items)
+            ],
+            "total": 1_000_000,
+            "page": 1,
+            "size": items,
+            "pages": 1_000_000 // items,
+        }
+    ).encode("utf-8")
+
+
+def run(label: str, compress, size: int, iterations: int) -> None:
+    start = time.process_time()
+    for _ in range(iterations):
+        body = compress()
+    elapsed = time.process_time() - start
+    print(f"{label:<12} {len(body):>9} bytes {100 * len(body) / size:6.1f}% {elapsed / iterations * 1e6:9.1f} us cpu")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    body = page(args.items)
+    run("identity", lambda: body, len(body), args.iterations)
+    for level in (1, 6, 9):
+        compressor = Compressor(["gzip"], minimum_size=0, gzip_level=level, brotli_quality=4)
+        run(f"gzip-{level}", lambda: compressor.compress(body, "gzip"), len(body), args.iterations)
+    for quality in (1, 4, 11):
+        compressor = Compressor(["br"], minimum_size=0, gzip_level=6, brotli_quality=quality)
+        if not compressor.encodings:
+            break
+        run(f"br-{quality}", lambda: compressor.compress(body, "br"), len(body), max(1, args.iterations // 10))
+    compressor = Compressor(["br", "gzip"], minimum_size=0, gzip_level=6, brotli_quality=4)
+    entry = CachedBody("benchmark", "application/json", body, expires_at=0)
+    entry.variant(compressor.encodings[0], compressor)
+    run("cached", lambda: entry.variant(compressor.encodings[0], compressor)[1], len(body), args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Cold start time: fresh interpreter importing the app and running its lifespan up to the first request.
+
+Each run is a new process so nothing is cached between runs. Requires the .env of a reachable database;
+with --import-only the lifespan is skipped and only module import time is measured. The target for the
+Render free tier is a lifespan under 500ms once the schema marker is current.
+
+    python -m benchmarks.bench_startup [--runs 5] [--import-only]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+CHILD = """
+import json, time
+start = time.perf_counter()
+import main
+timings = {"import": time.perf_counter() - start}
+if not IMPORT_ONLY:
+    from fastapi.testclient import TestClient
+    start = time.perf_counter()
+    with TestClient(main.app) as client:
+        timings["lifespan"] = time.perf_counter() - start
+        timings.update({f"  {k}": v for k, v in main.app.state.startup_timings.items()})
+        start = time.perf_counter()
+        client.get("/openapi.json")
+        timings["openapi"] = time.perf_counter() - start
+print(json.dumps(timings))
+"""
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-only", action="store_true")
+    args = parser.parse_args()
+
+    runs = []
+    for _ in range(args.runs):
+        child = CHILD.replace("IMPORT_ONLY", str(args.import_only))
+        output = subprocess.run([sys.executable, "-c", child], capture_output=True, text=True, check=True)
+        runs.append(json.loads(output.stdout.strip().splitlines()[-1]))
+    for phase in runs[0]:
+        values = [run[phase] * 1000 for run in runs if phase in run]
+        print(f"{phase:<20} median {statistics.median(values):8.1f} ms   max {max(values):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""CPU per primary-key read: statements rebuilt through a match per call vs. the prebuilt registry.
+
+Runs against an in-memory sqlite database by default so it only measures the python side (statement
+construction, cache key generation, compiled cache lookup). Pass --url with a postgres DSN to include
+the server-side parse that PREPARED_STATEMENTS removes.
+
+    python -m benchmarks.bench_statements [--url postgresql+pg8000://...] [--iterations 5000]
+"""
+
+import argparse
+import time
+import uuid
+
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from src.enums.Tables import Tables
+from src.services.data_database.statements import get_statements
+from src.services.data_database.tables import Activity, Reward, Tracking
+from src.services.prepared import enable_prepared_statements
+
+
+def rebuilt_statement(table: Tables, id: uuid.UUID):
+    match table:
+        case Tables.Rewards:
+            return select(Reward).where(Reward.id == id)
+        case Tables.Activity:
+            return select(Activity).where(Activity.id == id)
+        case Tables.Tracking:
+            return select(Tracking).where(Tracking.id == id)
+
+
+def run(label: str, read, iterations: int) -> None:
+    start = time.process_time()
+    for _ in range(iterations):
+        read()
+    elapsed = time.process_time() - start
+    print(f"{label:<10} {elapsed / iterations * 1e6:8.1f} us cpu/read")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="sqlite://")
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    engine = create_engine(args.url)
+    if args.url.startswith("postgresql+pg8000"):
+        enable_prepared_statements(engine)
+    SQLModel.metadata.create_all(engine, tables=[Reward.__table__])
+    with Session(engine) as session:
+        reward = Reward(id=uuid.uuid4(), name="benchmark", points=1)
+        session.add(reward)
+        session.commit()
+        id = reward.id
+
+        statements = get_statements(Tables.Rewards)
+        run("rebuilt", lambda: session.exec(rebuilt_statement(Tables.Rewards, id)).one(), args.iterations)
+        run("registry", lambda: session.exec(statements.select_by_id, params={"id": id}).one(), args.iterations)
+
+        session.delete(reward)
+        session.commit()
+
+
+if __name__ == "__main__":
+    main()
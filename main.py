@@ -1,17 +1,90 @@
+import asyncio
+import json
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi_pagination import add_pagination
 
-from src.routers import auth, data, user
-from src.services.data_database.engine import init_db
+from src.admission import AdmissionControlMiddleware
+from src.breaker import CircuitBreakerMiddleware
+from src.compression import CompressionMiddleware
+from src.deadline import DeadlineMiddleware
+from src.dependencies import drain_tracking_batchers
+from src.logging import logger
+from src.operations.scores import run_periodic_group_fold, run_periodic_reconciliation
+from src.profiling import ProfilingMiddleware, get_stack_sampler
+from src.routers import admin, auth, data, user
+from src.services.data_database.engine import get_shard_router, init_db, maintain_db, run_periodic_catalog_sync
+from src.services.compression import get_compressor
+from src.services.pool import warm_pool
+from src.services.user_database.engine import DatabaseEngine as UserDatabaseEngine
 from src.services.user_database.engine import init_user_db
-from src.settings import get_settings
+from src.settings import Settings, get_settings
+
+OPENAPI_PATH = Path(__file__).parent / "openapi.json"
+
+
+# region startup
+@contextmanager
+def startup_phase(name: str, timings: dict[str, float]):
+    start = time.perf_counter()
+    yield
+    timings[name] = time.perf_counter() - start
+
+
+def log_timings(label: str, timings: dict[str, float]) -> None:
+    logger.info(f"{label}: " + ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in timings.items()))
+
+
+async def warm_up(app: FastAPI, settings: Settings) -> None:
+    # runs after the app accepts requests, nothing here is needed to serve the first one
+    timings = app.state.startup_timings
+    with startup_phase("warm_pools", timings):
+        await asyncio.gather(
+            *(
+                asyncio.to_thread(warm_pool, engine, settings.pool_warmup_connections)
+                for engine in get_shard_router(settings).engines
+            ),
+            asyncio.to_thread(warm_pool, UserDatabaseEngine(settings).engine, settings.pool_warmup_connections),
+        )
+    with startup_phase("maintain_db", timings):
+        await maintain_db(settings=settings)
+    log_timings("startup background phases", timings)
 
 
 async def lifespan(app: FastAPI):
-    await init_user_db(settings=get_settings())
-    await init_db(settings=get_settings())
+    settings = get_settings()
+    app.state.startup_timings = timings = {}
+    with startup_phase("init_user_db", timings):
+        await init_user_db(settings=settings)
+    with startup_phase("init_db", timings):
+        await init_db(settings=settings)
+    if settings.static_openapi and OPENAPI_PATH.exists():
+        with startup_phase("openapi", timings):
+            app.openapi_schema = json.loads(OPENAPI_PATH.read_text())
+    log_timings("startup phases", timings)
+    background = [
+        asyncio.create_task(warm_up(app=app, settings=settings)),
+        asyncio.create_task(run_periodic_group_fold(settings=settings)),
+    ]
+    if settings.score_reconcile_interval_seconds:
+        background.append(asyncio.create_task(run_periodic_reconciliation(settings=settings)))
+    if settings.catalog_sync_interval_seconds:
+        background.append(asyncio.create_task(run_periodic_catalog_sync(settings=settings)))
+    if settings.profiling_sample_interval_seconds:
+        get_stack_sampler().start()
     yield
+    # acknowledged tracking writes still waiting on a batch go out before the app stops
+    await drain_tracking_batchers()
+    for task in background:
+        task.cancel()
+    get_stack_sampler().stop()
+
+
+# endregion
 
 
 origins = ["*"]
@@ -21,6 +94,27 @@ origins = ["*"]
 app = FastAPI(lifespan=lifespan)
 add_pagination(app)
 
+# region profiling
+app.add_middleware(ProfilingMiddleware, interval=get_settings().profiling_interval_seconds)
+
+# region deadlines
+app.add_middleware(DeadlineMiddleware, default_seconds=get_settings().request_deadline_seconds)
+
+# region admission control
+app.add_middleware(
+    AdmissionControlMiddleware,
+    max_concurrency=get_settings().admission_max_concurrency,
+    queue_timeout=get_settings().admission_queue_timeout_seconds,
+    pool_wait_threshold=get_settings().admission_pool_wait_threshold_seconds,
+    retry_after=get_settings().admission_retry_after_seconds,
+)
+
+# region circuit breakers
+app.add_middleware(CircuitBreakerMiddleware, max_stale=get_settings().stale_max_seconds)
+
+# region compression
+app.add_middleware(CompressionMiddleware, compressor=get_compressor())
+
 # region cors
 app.add_middleware(
     CORSMiddleware,
@@ -34,3 +128,4 @@ app.add_middleware(
 app.include_router(auth.router)
 app.include_router(user.router)
 app.include_router(data.router)
+app.include_router(admin.router)
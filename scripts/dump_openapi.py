@@ -0,0 +1,17 @@
+"""Regenerate the checked-in openapi.json that is served as-is when STATIC_OPENAPI is enabled.
+
+    python -m scripts.dump_openapi
+"""
+
+import json
+
+from main import OPENAPI_PATH, app
+
+
+def main() -> None:
+    OPENAPI_PATH.write_text(json.dumps(app.openapi(), separators=(",", ":")))
+    print(f"wrote {OPENAPI_PATH}")
+
+
+if __name__ == "__main__":
+    main()
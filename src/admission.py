@@ -0,0 +1,58 @@
+import asyncio
+import json
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from src.logging import logger
+from src.services.pool import pool_wait
+
+
+class AdmissionControlMiddleware:
+    """Bound the number of in-flight requests and shed load with 503 while the database pools are saturated."""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        max_concurrency: int,
+        queue_timeout: float,
+        pool_wait_threshold: float,
+        retry_after: int,
+    ) -> None:
+        self.app = app
+        self.queue_timeout = queue_timeout
+        self.pool_wait_threshold = pool_wait_threshold
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if pool_wait.average > self.pool_wait_threshold:
+            logger.warning(f"shedding request, average pool wait {pool_wait.average:.3f}s")
+            await self._reject(send)
+            return
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except TimeoutError:
+            await self._reject(send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self._semaphore.release()
+
+    async def _reject(self, send: Send) -> None:
+        body = json.dumps({"detail": "Service temporarily overloaded"}).encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("latin-1")),
+                    (b"retry-after", str(self.retry_after).encode("latin-1")),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,92 @@
+import json
+import math
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.enums.CircuitStates import CircuitStates
+from src.services.breaker import current_outages
+from src.services.compression import IDENTITY, get_response_cache
+
+
+class CircuitBreakerMiddleware:
+    """Turn errors caused by an unavailable database into a stale cached body or 503 with Retry-After."""
+
+    def __init__(self, app: ASGIApp, max_stale: float) -> None:
+        self.app = app
+        self.max_stale = max_stale
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        outages = []
+        token = current_outages.set(outages)
+        state = scope.setdefault("state", {})
+        replaced = False
+
+        async def send_or_fallback(message: Message) -> None:
+            nonlocal replaced
+            if message["type"] == "http.response.start":
+                # routes answer a failed query with 400, only the breakers know it was the database
+                if outages and message["status"] >= 400:
+                    replaced = await self._stale(state, send) or await self._unavailable(outages, send)
+                    if replaced:
+                        return
+                if state.get("stale_principal") is not None:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Warning", '199 - "Authenticated from cached credentials"')
+            elif replaced:
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_or_fallback)
+        finally:
+            current_outages.reset(token)
+
+    async def _stale(self, state: dict, send: Send) -> bool:
+        cache = state.get("response_cache")
+        entry = get_response_cache().get_stale(cache[0], self.max_stale) if cache is not None else None
+        if entry is None:
+            return False
+        # the compression middleware must not store the stale body as a fresh entry
+        state.pop("response_cache")
+        body = entry.variants[IDENTITY]
+        age = math.floor(time.monotonic() - entry.stored_at)
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", entry.media_type.encode("latin-1")),
+                    (b"content-length", str(len(body)).encode("latin-1")),
+                    (b"age", str(age).encode("latin-1")),
+                    (b"warning", b'110 - "Response is Stale"'),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+        return True
+
+    async def _unavailable(self, outages: list, send: Send) -> bool:
+        open_breakers = [i for i in outages if i.state != CircuitStates.Closed]
+        if not open_breakers:
+            return False
+        names = ", ".join(sorted(i.name for i in open_breakers))
+        body = json.dumps({"detail": f"Database temporarily unavailable: {names}"}).encode("utf-8")
+        retry_after = max(1, math.ceil(max(i.retry_after for i in open_breakers)))
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 503,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("latin-1")),
+                    (b"retry-after", str(retry_after).encode("latin-1")),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+        return True
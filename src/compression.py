@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+from fastapi import Request, Response
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.services.compression import CachedBody, Compressor, get_compressor, get_response_cache
+from src.settings import Settings
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript")
+# bodies above this are compressed in a worker thread so the event loop keeps serving other requests
+THREAD_THRESHOLD = 64 * 1024
+
+
+class CompressionMiddleware:
+    """Compress response bodies the client accepts, and fill the response cache for routes that asked for it."""
+
+    def __init__(self, app: ASGIApp, compressor: Compressor) -> None:
+        self.app = app
+        self.compressor = compressor
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = self.compressor.negotiate(Headers(scope=scope).get("accept-encoding"))
+        state = scope.setdefault("state", {})
+        start: Message | None = None
+        chunks: list[bytes] = []
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                media_type = headers.get("content-type", "")
+                if (
+                    message["status"] == 200
+                    and "content-encoding" not in headers
+                    and media_type.startswith(COMPRESSIBLE_TYPES)
+                ):
+                    # held back until the whole body is known
+                    start = message
+                    return
+            elif start is not None:
+                chunks.append(message.get("body", b""))
+                if message.get("more_body", False):
+                    return
+                await self._send(start, b"".join(chunks), encoding, state, send)
+                return
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+    async def _send(self, start: Message, body: bytes, encoding: str | None, state: dict, send: Send) -> None:
+        headers = MutableHeaders(scope=start)
+        headers.add_vary_header("Accept-Encoding")
+        cache = state.get("response_cache")
+        if cache is not None:
+            key, tag, ttl = cache
+            entry = CachedBody(tag, headers["content-type"], body, time.monotonic() + ttl)
+            get_response_cache().set(key, entry)
+            encoding, body = await self._run(len(body), entry.variant, encoding, self.compressor)
+        elif encoding is not None and len(body) >= self.compressor.minimum_size:
+            body = await self._run(len(body), self.compressor.compress, body, encoding)
+        else:
+            encoding = None
+        if encoding is not None:
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            if "etag" in headers and not headers["etag"].startswith("W/"):
+                # the compressed bytes differ from the ones a strong etag promises
+                headers["ETag"] = "W/" + headers["etag"]
+        await send(start)
+        await send({"type": "http.response.body", "body": body})
+
+    async def _run(self, size: int, compress, *args):
+        if size >= THREAD_THRESHOLD:
+            return await asyncio.to_thread(compress, *args)
+        return compress(*args)
+
+
+def cached_response(request: Request, settings: Settings, tag: str) -> Response | None:
+    """Answer from the response cache when the route has a ttl, otherwise mark the response to be cached."""
+    route = request.scope.get("route")
+    ttl = settings.response_cache_ttl_seconds.get(route.path) if route is not None else None
+    if not ttl:
+        return None
+    key = f"{request.url.path}?{'&'.join(sorted(request.url.query.split('&')))}"
+    entry = get_response_cache().get(key)
+    if entry is None:
+        request.state.response_cache = (key, tag, ttl)
+        return None
+    compressor = get_compressor()
+    encoding, body = entry.variant(compressor.negotiate(request.headers.get("accept-encoding")), compressor)
+    headers = {}
+    if encoding is not None:
+        # the middleware passes encoded bodies through untouched, Vary is only added for the others
+        headers = {"Content-Encoding": encoding, "Vary": "Accept-Encoding"}
+    return Response(content=body, media_type=entry.media_type, headers=headers)
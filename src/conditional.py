@@ -0,0 +1,23 @@
+from datetime import UTC, datetime
+from email.utils import format_datetime
+
+from fastapi import Request, Response, status
+
+
+def _etags(header: str) -> set[str]:
+    # weak and strong tags compare equal for If-None-Match
+    return {tag.strip().removeprefix("W/") for tag in header.split(",")}
+
+
+def not_modified(request: Request, response: Response, etag: str, last_modified: datetime | None) -> Response | None:
+    """Set the validators on the response, return a 304 when the client's copy is still current."""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if last_modified is not None:
+        # stored as naive utc
+        headers["Last-Modified"] = format_datetime(last_modified.replace(tzinfo=UTC), usegmt=True)
+    if_none_match = request.headers.get("if-none-match")
+    # only the etag is compared, Last-Modified does not move when activity points change
+    if if_none_match is not None and ("*" in _etags(if_none_match) or etag in _etags(if_none_match)):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,131 @@
+import asyncio
+import json
+import math
+from typing import Annotated
+
+from fastapi import Depends, Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.logging import logger
+from src.services.deadline import Deadline, current_deadline
+from src.settings import Settings, get_settings
+
+
+class DeadlineMiddleware:
+    """Give every request a deadline, cancel its queries when it passes or the client goes away, answer 504.
+
+    The checks run on the event loop; while a blocking pg8000 call holds it nothing here can run, so a query
+    that is already in flight is only limited by the statement_timeout set from the deadline.
+    """
+
+    def __init__(self, app: ASGIApp, default_seconds: float | None) -> None:
+        self.app = app
+        self.default_seconds = default_seconds
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        deadline = Deadline(self.default_seconds)
+        token = current_deadline.set(deadline)
+        # the body is handed to the app as it asks for it, so a streamed upload is never buffered here;
+        # only messages after the body go through the queue
+        headers = dict(scope["headers"])
+        body_read = asyncio.Event()
+        if b"transfer-encoding" not in headers and headers.get(b"content-length", b"0") == b"0":
+            body_read.set()
+        messages: asyncio.Queue[Message] = asyncio.Queue()
+        response_started = False
+
+        async def receive_body() -> Message:
+            if body_read.is_set():
+                return await messages.get()
+            message = await receive()
+            if message["type"] != "http.request" or not message.get("more_body", False):
+                body_read.set()
+            return message
+
+        async def watch_receive() -> None:
+            # the disconnect that follows the body is only seen here
+            await body_read.wait()
+            while True:
+                message = await receive()
+                await messages.put(message)
+                if message["type"] == "http.disconnect":
+                    return
+
+        async def send_or_timeout(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                if deadline.timed_out:
+                    await self._timeout(send)
+                    response_started = True
+                    return
+                response_started = True
+            elif message["type"] == "http.response.body" and deadline.timed_out:
+                return
+            await send(message)
+
+        app_task = asyncio.create_task(self.app(scope, receive_body, send_or_timeout))
+        watcher = asyncio.create_task(watch_receive())
+        try:
+            while not app_task.done():
+                # the route may move the deadline once it is resolved, so re-read it on every pass
+                timeout = None if math.isinf(deadline.remaining) else max(0.0, deadline.remaining)
+                await asyncio.wait({app_task, watcher}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if app_task.done():
+                    break
+                if watcher.done():
+                    deadline.cancelled = True
+                elif deadline.remaining <= 0:
+                    deadline.timed_out = True
+                else:
+                    continue
+                reason = "client disconnected" if deadline.cancelled else "deadline exceeded"
+                logger.warning(f"cancelling {scope['method']} {scope['path']} after {deadline.elapsed:.3f}s, {reason}")
+                try:
+                    await asyncio.to_thread(_cancel_backends, deadline)
+                except Exception as e:
+                    logger.error(f"cancelling the queries of {scope['path']} failed: {e}")
+                app_task.cancel()
+                break
+            try:
+                await app_task
+            except asyncio.CancelledError:
+                if deadline.timed_out and not response_started:
+                    await self._timeout(send)
+        finally:
+            watcher.cancel()
+            current_deadline.reset(token)
+
+    async def _timeout(self, send: Send) -> None:
+        body = json.dumps({"detail": "Request deadline exceeded"}).encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 504,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("latin-1")),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+def _cancel_backends(deadline: Deadline) -> None:
+    # the worker thread runs in a copy of the request's context, without the deadline the cancel isn't checked
+    current_deadline.set(None)
+    deadline.cancel_backends()
+
+
+async def apply_route_deadline(
+    request: Request,
+    settings: Annotated[Settings, Depends(get_settings)],
+) -> Deadline | None:
+    # routes are only resolved after the middleware, per-route overrides are applied here
+    deadline = current_deadline.get()
+    route = request.scope.get("route")
+    if deadline is not None and route is not None and route.path in settings.route_deadlines:
+        deadline.set_seconds(settings.route_deadlines[route.path])
+    return deadline
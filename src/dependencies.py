@@ -1,21 +1,78 @@
+import asyncio
 from typing import Annotated
 
 from fastapi import Depends
 from sqlmodel import Session
 
-from src.services.data_database.engine import DatabaseEngine as DataDatabaseEngine
+from src.deadline import apply_route_deadline
+from src.operations.tracking import TrackingBatcher
+from src.services.data_database.engine import ShardRouter, get_shard_router
+from src.services.data_database.shards import ShardSessions
+from src.services.deadline import Deadline
+from src.services.pool import TRANSACTION_POOLING
 from src.services.user_database.engine import DatabaseEngine as UserDatabaseEngine
+from src.settings import Settings, get_settings
 
 
 # region get session
-async def get_user_db_session(user_database_engine: Annotated[UserDatabaseEngine, Depends(UserDatabaseEngine)]):
-    with Session(user_database_engine.engine) as session:
+async def get_user_db_session(
+    user_database_engine: Annotated[UserDatabaseEngine, Depends(UserDatabaseEngine)],
+    settings: Annotated[Settings, Depends(get_settings)],
+    deadline: Annotated[Deadline | None, Depends(apply_route_deadline)],
+):
+    # with a transaction-mode pooler loaded users have to outlive the transaction that is ended to release them
+    with Session(
+        user_database_engine.engine,
+        expire_on_commit=not settings.transaction_pooling,
+        info={TRANSACTION_POOLING: settings.transaction_pooling},
+    ) as session:
         yield session
 
 
-async def get_data_db_session(database_engine: Annotated[DataDatabaseEngine, Depends(DataDatabaseEngine)]):
-    with Session(database_engine.engine) as session:
-        yield session
+async def get_shard_sessions(
+    router: Annotated[ShardRouter, Depends(get_shard_router)],
+    settings: Annotated[Settings, Depends(get_settings)],
+    deadline: Annotated[Deadline | None, Depends(apply_route_deadline)],
+):
+    shards = ShardSessions(router, transaction_pooling=settings.transaction_pooling)
+    try:
+        yield shards
+    finally:
+        shards.close()
+
+
+async def get_data_db_session(shards: Annotated[ShardSessions, Depends(get_shard_sessions)]):
+    # the primary data database, shared with the request's ShardSessions
+    yield shards.primary
+
+
+# endregion
+
+
+# region group commit
+_tracking_batchers: dict[str, TrackingBatcher] = {}
+
+
+async def get_tracking_batchers(
+    settings: Annotated[Settings, Depends(get_settings)],
+    router: Annotated[ShardRouter, Depends(get_shard_router)],
+) -> list[TrackingBatcher] | None:
+    # one batcher per shard, indexed like ShardRouter.engines
+    if not settings.tracking_group_commit:
+        return None
+    for engine in router.engines:
+        key = str(engine.url)
+        if key not in _tracking_batchers:
+            _tracking_batchers[key] = TrackingBatcher(
+                engine=engine,
+                max_batch_size=settings.tracking_group_commit_max_batch_size,
+                max_delay=settings.tracking_group_commit_max_delay_ms / 1000,
+            )
+    return [_tracking_batchers[str(engine.url)] for engine in router.engines]
+
+
+async def drain_tracking_batchers() -> None:
+    await asyncio.gather(*(batcher.drain() for batcher in _tracking_batchers.values()))
 
 
 # endregion
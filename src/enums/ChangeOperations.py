@@ -0,0 +1,6 @@
+from enum import StrEnum, auto
+
+
+class ChangeOperations(StrEnum):
+    Created = auto()
+    Deleted = auto()
@@ -0,0 +1,7 @@
+from enum import StrEnum, auto
+
+
+class CircuitStates(StrEnum):
+    Closed = auto()
+    Open = auto()
+    HalfOpen = auto()
@@ -0,0 +1,7 @@
+from enum import StrEnum, auto
+
+
+class CountStrategies(StrEnum):
+    Exact = auto()
+    Cached = auto()
+    Estimate = auto()
@@ -0,0 +1,6 @@
+from enum import StrEnum, auto
+
+
+class DistinctStrategies(StrEnum):
+    Exact = auto()
+    Approximate = auto()
@@ -0,0 +1,7 @@
+from enum import StrEnum, auto
+
+
+class HistogramIntervals(StrEnum):
+    Day = auto()
+    Week = auto()
+    Month = auto()
@@ -0,0 +1,6 @@
+from enum import StrEnum, auto
+
+
+class ImportFormats(StrEnum):
+    Csv = auto()
+    Ndjson = auto()
@@ -0,0 +1,6 @@
+from enum import StrEnum, auto
+
+
+class ProfileFormats(StrEnum):
+    Speedscope = auto()
+    Html = auto()
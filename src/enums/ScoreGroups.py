@@ -0,0 +1,6 @@
+from enum import StrEnum, auto
+
+
+class ScoreGroups(StrEnum):
+    Team = auto()
+    Country = auto()
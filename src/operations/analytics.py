@@ -0,0 +1,203 @@
+import math
+import uuid
+from collections import defaultdict
+from datetime import date, timedelta
+
+from fastapi import HTTPException, status
+from sqlalchemy import BigInteger, Date, Text, cast, func
+from sqlalchemy.dialects.postgresql import BIT
+from sqlmodel import Session, select
+
+from src.enums.DistinctStrategies import DistinctStrategies
+from src.enums.HistogramIntervals import HistogramIntervals
+from src.schemas.ActivityAnalyticsResponse import (
+    ActivityAnalytics,
+    ActivityAnalyticsResponse,
+    HistogramBucket,
+    PointsPercentiles,
+)
+from src.services.data_database.shards import ShardSessions, fan_out
+
+from .catalog import get_activity_snapshot
+from .scores import tracking_events
+
+HASH_BITS = 32
+# an approximate request takes the points percentiles from one in PERCENTILE_SAMPLE users, picked by hash
+PERCENTILE_SAMPLE = 16
+
+
+# region buckets
+def _truncate(day: date, interval: HistogramIntervals) -> date:
+    # same bucket starts as postgres date_trunc, weeks start on monday
+    match interval:
+        case HistogramIntervals.Week:
+            return day - timedelta(days=day.weekday())
+        case HistogramIntervals.Month:
+            return day.replace(day=1)
+    return day
+
+
+def _next_bucket(day: date, interval: HistogramIntervals) -> date:
+    match interval:
+        case HistogramIntervals.Week:
+            return day + timedelta(days=7)
+        case HistogramIntervals.Month:
+            return (day + timedelta(days=32)).replace(day=1)
+    return day + timedelta(days=1)
+
+
+def histogram_buckets(start: date, end: date, interval: HistogramIntervals, max_buckets: int) -> list[date]:
+    buckets = [_truncate(start, interval)]
+    while _next_bucket(buckets[-1], interval) <= end:
+        if len(buckets) >= max_buckets:
+            raise ValueError(f"At most {max_buckets} histogram buckets per request")
+        buckets.append(_next_bucket(buckets[-1], interval))
+    return buckets
+
+
+# endregion
+
+
+# region distinct users
+def hll_estimate(registers_set: int, inverse_sum: float, precision: int) -> int:
+    # inverse_sum covers the set registers only, every empty register adds 2^0
+    m = 1 << precision
+    zeros = m - registers_set
+    estimate = 0.7213 / (1 + 1.079 / m) * m * m / (inverse_sum + zeros)
+    if estimate <= 2.5 * m and zeros:
+        # linear counting is more accurate while many registers are still empty
+        estimate = m * math.log(m / zeros)
+    return round(estimate)
+
+
+def _percentiles(frequencies: dict[int, int], points: int) -> PointsPercentiles:
+    # nearest rank over the users' event counts, every event is worth the activity's points
+    ordered = sorted(frequencies.items())
+    total = sum(frequencies.values())
+
+    def rank(q: float) -> int:
+        seen = 0
+        for events, users in ordered:
+            seen += users
+            if seen >= max(1, math.ceil(q * total)):
+                return events * points
+        return 0
+
+    return PointsPercentiles(
+        p50=rank(0.5),
+        p90=rank(0.9),
+        p99=rank(0.99),
+        max=ordered[-1][0] * points if ordered else 0,
+    )
+
+
+# endregion
+
+
+# region analytics
+def _shard_aggregates(
+    session: Session,
+    start: date,
+    end: date,
+    interval: HistogramIntervals,
+    distinct: DistinctStrategies,
+    precision: int,
+) -> tuple[list, list, list]:
+    # everything is aggregated in postgres, the results grow with activities and buckets, not with the range
+    events = tracking_events(start=start, end=end)
+    bucket = cast(func.date_trunc(interval.value, events.c.day), Date)
+    histogram = session.exec(
+        select(events.c.activity_id, bucket, func.sum(events.c.events)).group_by(events.c.activity_id, bucket)
+    ).all()
+    user_hash = cast(func.hashtext(cast(events.c.user_id, Text)), BigInteger).op("&")(2**HASH_BITS - 1)
+    per_user = select(events.c.activity_id, func.sum(events.c.events).label("events")).group_by(
+        events.c.activity_id, events.c.user_id
+    )
+    if distinct == DistinctStrategies.Approximate:
+        per_user = per_user.where(user_hash < 2**HASH_BITS // PERCENTILE_SAMPLE)
+    per_user = per_user.subquery("per_user")
+    # users per event count, small enough to merge across shards and rank in memory
+    frequencies = session.exec(
+        select(per_user.c.activity_id, per_user.c.events, func.count()).group_by(
+            per_user.c.activity_id, per_user.c.events
+        )
+    ).all()
+    registers = []
+    if distinct == DistinctStrategies.Approximate:
+        # hyperloglog: the low bits pick a register, rho is the first set bit of the remaining ones
+        bits = HASH_BITS - precision
+        first_set = func.strpos(cast(cast(user_hash.op(">>")(precision), BIT(bits)), Text), "1")
+        maxima = (
+            select(events.c.activity_id, func.max(func.coalesce(func.nullif(first_set, 0), bits + 1)).label("rho"))
+            .group_by(events.c.activity_id, user_hash.op("&")(2**precision - 1))
+            .subquery("registers")
+        )
+        registers = session.exec(
+            select(maxima.c.activity_id, func.count(), func.sum(func.power(2.0, -maxima.c.rho))).group_by(
+                maxima.c.activity_id
+            )
+        ).all()
+    return histogram, frequencies, registers
+
+
+async def get_activity_analytics(
+    session: Session,
+    start: date | None = None,
+    end: date | None = None,
+    interval: HistogramIntervals = HistogramIntervals.Day,
+    distinct: DistinctStrategies = DistinctStrategies.Exact,
+    max_buckets: int = 366,
+    hll_precision: int = 12,
+    shards: ShardSessions | None = None,
+) -> ActivityAnalyticsResponse:
+    try:
+        end = end or date.today()
+        start = start or end - timedelta(days=29)
+        if start > end:
+            raise ValueError("start must not be after end")
+        buckets = histogram_buckets(start, end, interval, max_buckets)
+        sessions = shards.all() if shards is not None else [session]
+        parts = await fan_out(
+            sessions,
+            lambda s: _shard_aggregates(s, start, end, interval, distinct, hll_precision),
+        )
+        histograms: dict[uuid.UUID, dict[date, int]] = defaultdict(lambda: dict.fromkeys(buckets, 0))
+        frequencies: dict[uuid.UUID, dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        distinct_users: dict[uuid.UUID, int] = defaultdict(int)
+        for histogram, frequency, registers in parts:
+            for activity_id, day, events in histogram:
+                histograms[activity_id][day] += events
+            for activity_id, events, users in frequency:
+                frequencies[activity_id][events] += users
+                if distinct == DistinctStrategies.Exact:
+                    distinct_users[activity_id] += users
+            for activity_id, registers_set, inverse_sum in registers:
+                # every user lives on one shard, the estimates of the shards add up
+                distinct_users[activity_id] += hll_estimate(registers_set, float(inverse_sum), hll_precision)
+        activities = [
+            ActivityAnalytics(
+                activity_id=id,
+                name=activity.name,
+                events=sum(histograms[id].values()),
+                distinct_users=distinct_users[id],
+                points=_percentiles(frequencies[id], activity.points),
+                histogram=[HistogramBucket(start=day, events=events) for day, events in histograms[id].items()],
+            )
+            for id, activity in get_activity_snapshot().get(session).items()
+        ]
+        activities.sort(key=lambda x: x.events, reverse=True)
+        return ActivityAnalyticsResponse(
+            start=start,
+            end=end,
+            interval=interval,
+            distinct=distinct,
+            activities=activities,
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to get activity analytics: {str(e)}",
+        )
+
+
+# endregion
@@ -1,16 +1,22 @@
 import os
+import threading
+import time
 from datetime import UTC, datetime, timedelta
+from functools import lru_cache
 from typing import Annotated
 
 import bcrypt
-from fastapi import HTTPException, status
+from fastapi import HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from src.dependencies import *
+from src.enums.Roles import Roles
 from src.schemas.Token import TokenData
-from src.services.user_database.tables import User
+from src.services.breaker import current_outages
+from src.services.pool import release_connection
+from src.services.user_database.tables import User, UserInDB
 from src.settings import Settings, get_settings
 
 from .user import get_user
@@ -18,6 +24,30 @@ from .user import get_user
 oauth2_schema = OAuth2PasswordBearer(tokenUrl="auth/token")
 
 
+class PrincipalCache:
+    """The last principal loaded per username, used while the user database is unavailable."""
+
+    def __init__(self) -> None:
+        self._principals: dict[str, tuple[UserInDB, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, username: str, max_age: float) -> tuple[UserInDB, float] | None:
+        with self._lock:
+            cached = self._principals.get(username)
+        if cached is None or time.monotonic() - cached[1] > max_age:
+            return None
+        return cached[0], time.monotonic() - cached[1]
+
+    def set(self, username: str, user: UserInDB) -> None:
+        with self._lock:
+            self._principals[username] = (user, time.monotonic())
+
+
+@lru_cache
+def get_principal_cache() -> PrincipalCache:
+    return PrincipalCache()
+
+
 async def verify_password(
     plain_password: str,
     hashed_password: str,
@@ -54,6 +84,7 @@ async def create_access_token(
 
 
 async def get_current_user(
+    request: Request,
     token: Annotated[str, Depends(oauth2_schema)],
     settings: Annotated[Settings, Depends(get_settings)],
     session: AsyncSession = Depends(get_user_db_session),
@@ -73,9 +104,21 @@ async def get_current_user(
     except JWTError:
         raise credential_exception
 
-    user = await get_user(session, token_data.username)
+    principals = get_principal_cache()
+    try:
+        user = await get_user(session, token_data.username)
+    except Exception:
+        # the token is valid, a recently seen principal stands in when its database is unavailable
+        cached = principals.get(token_data.username, settings.stale_max_seconds) if current_outages.get() else None
+        if cached is None:
+            raise
+        user, age = cached
+        request.state.stale_principal = age
+        return user
     if not user:
         raise credential_exception
+    release_connection(session)
+    principals.set(token_data.username, user)
     return user
 
 
@@ -83,3 +126,9 @@ async def get_current_active_user(current_user: Annotated[User, Depends(get_curr
     if current_user.deactivated:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
+
+
+async def get_current_admin_user(current_user: Annotated[User, Depends(get_current_active_user)]):
+    if current_user.role not in (Roles.Admin, Roles.SuperAdmin):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin privileges required")
+    return current_user
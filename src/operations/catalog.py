@@ -0,0 +1,93 @@
+import threading
+import time
+import uuid
+from functools import lru_cache
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, select
+
+from src.enums.Tables import Tables
+from src.services.data_database.tables import Activity, CatalogVersion
+from src.settings import get_settings
+
+
+# region catalog version
+def bump_catalog_version(session: Session, table: Tables) -> None:
+    # runs inside the caller's transaction, other workers notice the new version on their next check
+    statement = pg_insert(CatalogVersion).values(name=table.value, version=1)
+    session.exec(
+        statement.on_conflict_do_update(
+            index_elements=[CatalogVersion.name],
+            set_={"version": CatalogVersion.version + 1},
+        )
+    )
+
+
+def get_catalog_version(session: Session, table: Tables) -> int:
+    statement = select(CatalogVersion.version).where(CatalogVersion.name == table.value)
+    return session.exec(statement).one_or_none() or 0
+
+
+def lock_activity_points(session: Session, ids: set[uuid.UUID]) -> dict[uuid.UUID, int]:
+    # points for the score deltas of tracking writes, read in the write transaction instead of from the
+    # snapshot, which lags other workers' points changes; FOR KEY SHARE (what the tracking foreign key
+    # takes anyway) makes a concurrent points change wait for this write, or this write for the change
+    statement = select(Activity.id, Activity.points).where(Activity.id.in_(ids))
+    points = dict(session.exec(statement.with_for_update(read=True, key_share=True)).all())
+    if ids - points.keys():
+        raise ValueError("Activity not found")
+    return points
+
+
+# endregion
+
+
+# region activity snapshot
+class ActivitySnapshot:
+    """In-process copy of the activity catalog, reloaded when its catalog version changes."""
+
+    def __init__(self, check_interval: float) -> None:
+        self.check_interval = check_interval
+        self.version = -1
+        self.activities: dict[uuid.UUID, Activity] = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        self._checked_at = 0.0
+
+    def get(self, session: Session) -> dict[uuid.UUID, Activity]:
+        if time.monotonic() - self._checked_at < self.check_interval:
+            return self.activities
+        with self._lock:
+            if time.monotonic() - self._checked_at >= self.check_interval:
+                version = get_catalog_version(session, Tables.Activity)
+                if version != self.version:
+                    # detached copies, callers only read them or attach them with set_committed_value
+                    self.activities = {
+                        i.id: Activity.model_validate(i.model_dump()) for i in session.exec(select(Activity))
+                    }
+                    self.version = version
+                self._checked_at = time.monotonic()
+        return self.activities
+
+    def require(self, session: Session, ids: set[uuid.UUID]) -> dict[uuid.UUID, Activity]:
+        activities = self.get(session)
+        if ids - activities.keys():
+            # possibly created by another worker since the last version check
+            self.invalidate()
+            activities = self.get(session)
+            if ids - activities.keys():
+                raise ValueError("Activity not found")
+        return activities
+
+    def points(self, session: Session) -> dict[uuid.UUID, int]:
+        return {id: activity.points for id, activity in self.get(session).items()}
+
+
+@lru_cache
+def get_activity_snapshot() -> ActivitySnapshot:
+    return ActivitySnapshot(check_interval=get_settings().activity_snapshot_check_interval_seconds)
+
+
+# endregion
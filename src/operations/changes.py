@@ -0,0 +1,158 @@
+import asyncio
+import heapq
+import time
+
+from fastapi import HTTPException, status
+from sqlalchemy import BigInteger, Insert, Text, func, insert, literal, tuple_
+from sqlmodel import Session, select
+
+from src.enums.ChangeOperations import ChangeOperations
+from src.schemas.TrackingChangesResponse import TrackingChangeRead, TrackingChangesResponse
+from src.services.data_database.shards import ShardSessions, fan_out
+from src.services.data_database.tables import Tracking, TrackingChange
+from src.services.deadline import current_deadline
+
+# every transaction with a txid below the snapshot's xmin has finished, its outbox rows can no longer appear;
+# xmin is cluster wide, any long or idle in transaction session holds back the whole feed until it ends
+SNAPSHOT_XMIN = func.pg_snapshot_xmin(func.pg_current_snapshot()).cast(Text).cast(BigInteger)
+
+
+# region cursor
+def encode_cursor(txid: int, seq: int) -> str:
+    return f"{txid}-{seq}"
+
+
+def decode_cursor(cursor: str | None) -> tuple[int, int]:
+    if not cursor:
+        return 0, 0
+    try:
+        txid, seq = cursor.split("-")
+        return int(txid), int(seq)
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def encode_shard_cursor(positions: list[tuple[int, int]]) -> str:
+    # one position per shard, a single shard keeps the plain "txid-seq" form
+    return ".".join(encode_cursor(txid, seq) for txid, seq in positions)
+
+
+def decode_shard_cursor(cursor: str | None, shards: int) -> list[tuple[int, int]]:
+    positions = [decode_cursor(i) for i in cursor.split(".")] if cursor else []
+    if len(positions) > shards:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    # shards added since the cursor was issued are read from the start
+    return positions + [(0, 0)] * (shards - len(positions))
+
+
+# endregion
+
+
+# region record
+def record_tracking_changes(session: Session, operation: ChangeOperations, rows: list[Tracking]) -> None:
+    # inside the caller's transaction, the change is visible exactly when the tracking write commits
+    if not rows:
+        return
+    session.exec(
+        insert(TrackingChange),
+        params=[
+            {
+                "operation": operation.value,
+                "tracking_id": row.id,
+                "user_id": row.user_id,
+                "activity_id": row.activity_id,
+                "added_at": row.added_at,
+            }
+            for row in rows
+        ],
+    )
+
+
+def record_deleted_tracking(deleted) -> Insert:
+    # deleted is a DELETE ... RETURNING cte, the outbox rows are written by the same statement
+    return insert(TrackingChange).from_select(
+        ["operation", "tracking_id", "user_id", "activity_id", "added_at"],
+        select(
+            literal(ChangeOperations.Deleted.value, Text),
+            deleted.c.id,
+            deleted.c.user_id,
+            deleted.c.activity_id,
+            deleted.c.added_at,
+        ),
+    ).add_cte(deleted)
+
+
+# endregion
+
+
+# region change feed
+def _read_changes(session: Session, txid: int, seq: int, limit: int) -> list[TrackingChange]:
+    # xmin is taken in the same statement as the rows, so nothing still in flight below the cursor is skipped
+    statement = (
+        select(TrackingChange)
+        .where(tuple_(TrackingChange.txid, TrackingChange.seq) > tuple_(txid, seq))
+        .where(TrackingChange.txid < SNAPSHOT_XMIN)
+        .order_by(TrackingChange.txid, TrackingChange.seq)
+        .limit(limit)
+    )
+    changes = session.exec(statement).all()
+    # keep the loaded rows and do not hold a pooled connection while waiting for the next poll
+    session.expunge_all()
+    session.rollback()
+    return changes
+
+
+async def _read_shard_changes(
+    sessions: list[Session],
+    positions: list[tuple[int, int]],
+    limit: int,
+) -> list[tuple[int, TrackingChange]]:
+    position_of = dict(zip(sessions, positions))
+    pages = await fan_out(sessions, lambda s: _read_changes(s, *position_of[s], limit))
+    # each shard is ordered by its own (txid, seq), the pages are interleaved by change time
+    merged = heapq.merge(
+        *([(index, change) for change in page] for index, page in enumerate(pages)),
+        key=lambda x: x[1].changed_at,
+    )
+    return list(merged)[:limit]
+
+
+async def get_tracking_changes(
+    session: Session,
+    since: str | None = None,
+    limit: int = 500,
+    wait: float = 0,
+    poll_interval: float = 0.5,
+    shards: ShardSessions | None = None,
+) -> TrackingChangesResponse:
+    try:
+        sessions = shards.all() if shards is not None else [session]
+        positions = decode_shard_cursor(since, len(sessions))
+        deadline = current_deadline.get()
+        if deadline is not None:
+            # answer with an empty page before the request deadline turns the long poll into a 504
+            wait = min(wait, deadline.remaining - poll_interval)
+        expires_at = time.monotonic() + wait
+        changes = await _read_shard_changes(sessions, positions, limit)
+        while not changes and time.monotonic() + poll_interval < expires_at:
+            await asyncio.sleep(poll_interval)
+            changes = await _read_shard_changes(sessions, positions, limit)
+        rows = []
+        for index, change in changes:
+            # the cursor of a change resumes every shard right after what was returned up to it
+            positions[index] = change.txid, change.seq
+            rows.append(
+                TrackingChangeRead(
+                    cursor=encode_shard_cursor(positions),
+                    **change.model_dump(exclude={"txid", "seq"}),
+                )
+            )
+        return TrackingChangesResponse(changes=rows, cursor=encode_shard_cursor(positions))
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to get changes: {str(e)}",
+        )
+
+
+# endregion
@@ -0,0 +1,82 @@
+import threading
+import time
+from functools import lru_cache
+
+from sqlalchemy import text
+from sqlmodel import Session
+
+from src.enums.CountStrategies import CountStrategies
+from src.enums.Tables import Tables
+from src.settings import get_settings
+
+
+# region count cache
+class CountCache:
+    """Exact totals of paginated queries, dropped after ttl seconds or when this worker writes to their table."""
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self._counts: dict[tuple, tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> int | None:
+        with self._lock:
+            entry = self._counts.get(key)
+        if entry is None or entry[1] < time.monotonic():
+            return None
+        return entry[0]
+
+    def set(self, key: tuple, count: int) -> None:
+        with self._lock:
+            self._counts[key] = (count, time.monotonic() + self.ttl)
+
+    def invalidate(self, table: Tables) -> None:
+        # other workers only notice through the ttl
+        with self._lock:
+            for key in [key for key in self._counts if key[0] == table]:
+                del self._counts[key]
+
+
+@lru_cache
+def get_count_cache() -> CountCache:
+    return CountCache(ttl=get_settings().count_cache_ttl_seconds)
+
+
+# endregion
+
+
+# region counting
+def estimate_rows(session: Session, table_name: str) -> int:
+    # planner statistics of the table and, for partitioned tables, of every partition; -1 means never analyzed
+    statement = text(
+        "SELECT COALESCE(SUM(GREATEST(reltuples, 0)), 0) FROM pg_class "
+        "WHERE oid = to_regclass(:table) "
+        "OR oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(:table))"
+    )
+    return int(session.exec(statement, params={"table": table_name}).scalar_one())
+
+
+def count_rows(
+    session: Session,
+    statement,
+    strategy: CountStrategies,
+    key: tuple,
+    table_name: str | None = None,
+) -> int:
+    # table_name is only given for unfiltered queries, estimates of filtered queries fall back to the cache
+    if strategy == CountStrategies.Estimate and table_name is not None:
+        estimate = estimate_rows(session, table_name)
+        # small or never analyzed tables are cheap to count and badly estimated
+        if estimate >= get_settings().count_estimate_exact_below:
+            return estimate
+    if strategy == CountStrategies.Exact:
+        return session.exec(statement).one()
+    cache = get_count_cache()
+    count = cache.get(key)
+    if count is None:
+        count = session.exec(statement).one()
+        cache.set(key, count)
+    return count
+
+
+# endregion
@@ -1,47 +1,101 @@
+import heapq
 import uuid
+from collections import defaultdict
+from datetime import date
+from itertools import chain, islice
 from typing import List, Union
 
 from fastapi import HTTPException, status
+from fastapi_pagination import Page, Params
+from sqlalchemy import delete, func, insert, update
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import set_committed_value
 from sqlmodel import Session, select
 
+from src.enums.ChangeOperations import ChangeOperations
+from src.enums.CountStrategies import CountStrategies
 from src.enums.Tables import Tables
+from src.logging import logger
 from src.schemas.AggregatedScores import AggregatedScores, DailyScore
 from src.schemas.DeleteResponse import DeleteResponse
 from src.schemas.TotalScoreResponse import TotalScoreResponse, TotalUserScoreResponse
 from src.services.data_database.tables import (
     Activity,
     ActivityCreate,
+    ActivityRead,
     ActivityUpdate,
     Reward,
     RewardCreate,
+    RewardRead,
     RewardUpdate,
     Tracking,
     TrackingCreate,
     TrackingUpdate,
     TrackingWithActivityRead,
+    UserScore,
 )
-from src.utils import datetime_to_date, str_to_uuid, uuid_to_str
+from src.services.compression import get_response_cache
+from src.services.data_database.replication import CATALOG_TABLES
+from src.services.data_database.shards import ShardSessions, fan_out, replicate_catalog
+from src.services.data_database.statements import get_statements, select_page_columns
+from src.services.fieldsets import sparse_model
+from src.services.pool import release_connection
+from src.services.user_database.tables import User, UserInDB, UserRead
+from src.utils import str_to_uuid
 
-from .user import get_users
+from .catalog import bump_catalog_version, get_activity_snapshot, lock_activity_points
+from .changes import record_deleted_tracking, record_tracking_changes
+from .counts import count_rows, get_count_cache
+from .scores import apply_activity_points_change, apply_score_deltas, is_colocated, tracking_events
+from .tracking import TrackingBatcher, insert_tracking
+from .versions import bump_user_versions
+
+# the response models of the list endpoints, fields= narrows them
+READ_MODELS = {
+    Tables.Rewards: RewardRead,
+    Tables.Activity: ActivityRead,
+    Tables.Tracking: TrackingWithActivityRead,
+}
+
+
+def shift_replica_scores(shards: ShardSessions, deltas: dict[uuid.UUID, int]) -> None:
+    # scores of the other shards are shifted after the primary commits; the write already succeeded,
+    # so a failing shard is logged and left to the score reconciliation
+    for shard in shards.replicas():
+        try:
+            for activity_id, delta in deltas.items():
+                apply_activity_points_change(session=shard, activity_id=activity_id, delta=delta)
+            shard.commit()
+        except Exception as e:
+            shard.rollback()
+            logger.warning(f"shifting scores on {shard.get_bind().url.database} failed: {e}")
 
 
 # region add data
 async def add_data(
     session: Session,
     data: Union[RewardCreate, ActivityCreate, TrackingCreate],
+    shards: ShardSessions | None = None,
 ) -> Reward | Activity | Tracking:
     try:
         match data:
             case RewardCreate():
-                db_data = Reward.model_validate(data)
+                model, table = Reward, Tables.Rewards
             case ActivityCreate():
-                db_data = Activity.model_validate(data)
+                model, table = Activity, Tables.Activity
             case _:
                 raise ValueError("Invalid data type")
-        session.add(db_data)
+        # id is generated by the database and handed back by RETURNING, no refresh needed
+        db_data = session.exec(insert(model).returning(model), params=[data.model_dump()]).scalar_one()
+        if model is Activity:
+            bump_catalog_version(session=session, table=Tables.Activity)
         session.commit()
-        session.refresh(db_data)
+        if shards is not None:
+            await replicate_catalog(shards, table, {db_data.id})
+        get_count_cache().invalidate(table)
+        get_response_cache().invalidate(table)
+        if model is Activity:
+            get_activity_snapshot().invalidate()
         return db_data
     except IntegrityError as e:
         session.rollback()
@@ -60,15 +114,17 @@ async def add_data(
 async def add_tracking(
     session: Session,
     data: TrackingCreate,
-    user_id: str,
+    user: UserInDB,
+    batcher: TrackingBatcher | None = None,
 ) -> Tracking:
     try:
-        data = data.model_dump()
-        data["user_id"] = uuid_to_str(user_id)
-        db_data = Tracking.model_validate(data)
-        session.add(db_data)
-        session.commit()
-        session.refresh(db_data)
+        if batcher is not None:
+            db_data = await batcher.submit(data=data, user=user)
+        else:
+            # id and added_at are generated by the database and handed back by RETURNING
+            db_data = insert_tracking(session=session, items=[(data, user)])[0]
+            session.commit()
+        get_count_cache().invalidate(Tables.Tracking)
         return db_data
     except IntegrityError as e:
         session.rollback()
@@ -88,21 +144,76 @@ async def add_tracking(
 
 
 # region get data
+def _page_columns(table: Tables, fields: tuple[str, ...]) -> tuple[str, ...]:
+    # the requested columns plus those the ordering, the shard merge and the activity lookup need
+    columns = [i for i in fields if i != "activity"]
+    if table == Tables.Tracking:
+        columns += ["id", "added_at"] + (["activity_id"] if "activity" in fields else [])
+    return tuple(dict.fromkeys(columns or ["id"]))
+
+
+def _sparse_items(table: Tables, fields: tuple[str, ...], rows: list, activities: dict) -> list:
+    # rows come straight from the database, the slim models are built without validating them again
+    model = sparse_model(READ_MODELS[table], fields)
+    reads = {}
+    items = []
+    for row in rows:
+        values = {i: row._mapping[i] for i in fields if i != "activity"}
+        if "activity" in fields:
+            if row.activity_id not in reads:
+                reads[row.activity_id] = ActivityRead.model_validate(activities[row.activity_id])
+            values["activity"] = reads[row.activity_id]
+        items.append(model.model_construct(**values))
+    return items
+
+
 async def get_data(
     session: Session,
     table: Tables,
-) -> List[Union[Reward, Activity, Tracking]]:
+    params: Params,
+    count: CountStrategies = CountStrategies.Exact,
+    shards: ShardSessions | None = None,
+    fields: tuple[str, ...] | None = None,
+) -> Page[Union[Reward, Activity, Tracking]]:
     try:
-        match table:
-            case Tables.Rewards:
-                statement = select(Reward)
-            case Tables.Activity:
-                statement = select(Activity)
-            case Tables.Tracking:
-                statement = select(Tracking)
-            case _:
-                raise ValueError("Invalid table type")
-        return list(session.exec(statement).fetchall())
+        statements = get_statements(table)
+        select_page = statements.select_page
+        if fields is not None:
+            select_page = select_page_columns(table, _page_columns(table, fields))
+        raw_params = params.to_raw_params()
+        # the catalogs are complete on the primary, tracking is spread over every shard
+        sessions = shards.all() if shards is not None and table == Tables.Tracking else [session]
+        if len(sessions) == 1:
+            items = session.exec(
+                select_page,
+                params={"limit": raw_params.limit, "offset": raw_params.offset},
+            ).all()
+        else:
+            # every shard returns its first offset + limit rows, the page is cut from their merge
+            window = {"limit": raw_params.offset + raw_params.limit, "offset": 0}
+            pages = await fan_out(sessions, lambda s: s.exec(select_page, params=window).all())
+            merged = heapq.merge(*pages, key=lambda i: (-i.added_at.timestamp(), str(i.id)))
+            items = list(islice(merged, raw_params.offset, raw_params.offset + raw_params.limit))
+        activities = {}
+        if table == Tables.Tracking and (fields is None or "activity" in fields):
+            activities = get_activity_snapshot().require(session, {i.activity_id for i in items})
+        if fields is not None:
+            items = _sparse_items(table, fields, items, activities)
+        elif table == Tables.Tracking:
+            for i in items:
+                set_committed_value(i, "activity", activities[i.activity_id])
+        counts = await fan_out(
+            sessions,
+            lambda s: count_rows(
+                session=s,
+                statement=statements.count_all,
+                strategy=count,
+                key=(table, str(s.get_bind().url)),
+                table_name=statements.model.__tablename__,
+            ),
+        )
+        page = Page if fields is None else Page[sparse_model(READ_MODELS[table], fields)]
+        return page.create(items, params, total=sum(counts))
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -116,16 +227,7 @@ async def get_data_by_id(
     id: str,
 ) -> List[Reward | Activity | Tracking]:
     try:
-        match table:
-            case Tables.Rewards:
-                statement = select(Reward).where(Reward.id == id)
-            case Tables.Activity:
-                statement = select(Activity).where(Activity.id == id)
-            case Tables.Tracking:
-                statement = select(Tracking).where(Tracking.id == id)
-            case _:
-                raise ValueError("Invalid table type")
-        return session.exec(statement)
+        return session.exec(get_statements(table).select_by_id, params={"id": id})
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -136,12 +238,27 @@ async def get_data_by_id(
 async def get_user_activities(
     session: Session,
     user_id: str,
-) -> List[Activity]:
+    params: Params,
+    count: CountStrategies = CountStrategies.Exact,
+) -> Page[Activity]:
     try:
-        statement = select(Tracking).where(Tracking.user_id == user_id)
-        data = session.exec(statement).fetchall()
-        data = [TrackingWithActivityRead.model_validate(i) for i in data]
-        return [i.activity for i in data]
+        raw_params = params.to_raw_params()
+        statement = (
+            select(Tracking.activity_id)
+            .where(Tracking.user_id == user_id)
+            .order_by(Tracking.added_at.desc(), Tracking.id)
+            .limit(raw_params.limit)
+            .offset(raw_params.offset)
+        )
+        activity_ids = session.exec(statement).all()
+        activities = get_activity_snapshot().require(session, set(activity_ids))
+        total = count_rows(
+            session=session,
+            statement=select(func.count()).select_from(Tracking).where(Tracking.user_id == user_id),
+            strategy=count,
+            key=(Tables.Tracking, str(user_id)),
+        )
+        return Page.create([activities[i] for i in activity_ids], params, total=total)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -153,24 +270,24 @@ async def get_total_user_score(
     data_session: Session,
     user_session: Session,
     user_id: uuid.UUID,
+    start: date | None = None,
+    end: date | None = None,
 ) -> TotalUserScoreResponse:
     try:
-        users = await get_users(session=user_session)
-        if user_id not in [i.id for i in users]:
+        user = user_session.get(User, user_id)
+        if user is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found",
             )
-        for i in users:
-            if i.id == user_id:
-                user = i
-                break
-        statement = select(Tracking).where(Tracking.user_id == user_id)
-        data = data_session.exec(statement).fetchall()
-        data = [TrackingWithActivityRead.model_validate(i) for i in data]
+        release_connection(user_session)
+        # count events per activity over tracking alone and multiply by the in-process points snapshot
+        points = get_activity_snapshot().points(data_session)
+        events = tracking_events(user_id=user_id, start=start, end=end)
+        statement = select(events.c.activity_id, func.sum(events.c.events)).group_by(events.c.activity_id)
         return TotalUserScoreResponse(
-            user=user,
-            total_score=sum([i.activity.points for i in data]),
+            user=UserRead.model_validate(user),
+            total_score=sum(points.get(activity_id, 0) * count for activity_id, count in data_session.exec(statement)),
         )
     except Exception as e:
         raise HTTPException(
@@ -183,33 +300,32 @@ async def get_user_daily_scores(
     data_session: Session,
     user_session: Session,
     user_id: uuid.UUID,
+    start: date | None = None,
+    end: date | None = None,
 ) -> AggregatedScores:
     try:
-        users = await get_users(session=user_session)
-        if user_id not in [i.id for i in users]:
+        user = user_session.get(User, user_id)
+        if user is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="User not found",
             )
-        for i in users:
-            if i.id == user_id:
-                user = i
-                break
-        statement = select(Tracking).where(Tracking.user_id == user_id)
-        data = data_session.exec(statement).fetchall()
-        data = [TrackingWithActivityRead.model_validate(i) for i in data]
-        data.sort(key=lambda x: x.added_at, reverse=False)
-        daily_scores = {}
+        release_connection(user_session)
+        points = get_activity_snapshot().points(data_session)
+        events = tracking_events(user_id=user_id, start=start, end=end)
+        statement = (
+            select(events.c.day, events.c.activity_id, func.sum(events.c.events))
+            .group_by(events.c.day, events.c.activity_id)
+            .order_by(events.c.day)
+        )
+        scores = {}
+        for day, activity_id, count in data_session.exec(statement):
+            scores[day] = scores.get(day, 0) + points.get(activity_id, 0) * count
+        daily_scores = []
         cumulative_score = 0
-        for i in data:
-            date = datetime_to_date(i.added_at)
-            if date not in daily_scores:
-                daily_scores[date] = 0
-            daily_scores[date] += i.activity.points
-        for i in daily_scores:
-            cumulative_score += daily_scores[i]
-            daily_scores[i] = DailyScore(date=i, score=daily_scores[i], cumulative_score=cumulative_score)
-        daily_scores = list(daily_scores.values())
+        for day, score in scores.items():
+            cumulative_score += score
+            daily_scores.append(DailyScore(date=day, score=score, cumulative_score=cumulative_score))
         return AggregatedScores(
             user_id=user_id,
             user_name=user.username,
@@ -225,24 +341,42 @@ async def get_user_daily_scores(
 async def get_total_scores(
     data_session: Session,
     user_session: Session,
+    limit: int = 5,
+    shards: ShardSessions | None = None,
 ) -> TotalScoreResponse:
     try:
-        users = await get_users(session=user_session)
+        statement = select(UserScore.user_id, UserScore.score).order_by(UserScore.score.desc()).limit(limit)
+        if shards is not None and len(shards) > 1:
+            # the top limit of every shard contains the global top limit
+            pages = await fan_out(shards.all(), lambda s: s.exec(statement).all())
+            scores = dict(heapq.nlargest(limit, chain(*pages), key=lambda row: row[1]))
+            statement = select(User).where(User.id.in_(list(scores)))
+            users = {i.id: UserRead.model_validate(i) for i in user_session.exec(statement)}
+        elif is_colocated(data_session, user_session):
+            # top scores and their user rows in one statement
+            rows = data_session.exec(statement.join(User, User.id == UserScore.user_id).add_columns(User)).all()
+            scores = {id: score for id, score, _ in rows}
+            users = {id: UserRead.model_validate(user) for id, _, user in rows}
+        else:
+            scores = dict(data_session.exec(statement).all())
+            release_connection(data_session)
+            statement = select(User).where(User.id.in_(list(scores)))
+            users = {i.id: UserRead.model_validate(i) for i in user_session.exec(statement)}
+        if len(users) < limit:
+            # fewer than limit users have scored, fill up with users that have not tracked anything yet
+            statement = select(User).where(User.id.not_in(list(scores))).limit(limit - len(users))
+            users |= {i.id: UserRead.model_validate(i) for i in user_session.exec(statement)}
         if not users:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Users not found",
             )
         total_scores = [
-            await get_total_user_score(
-                data_session=data_session,
-                user_session=user_session,
-                user_id=i.id,
-            )
-            for i in users
+            TotalUserScoreResponse(user=user, total_score=scores.get(id, 0))
+            for id, user in users.items()
         ]
         total_scores.sort(key=lambda x: x.total_score, reverse=True)
-        return TotalScoreResponse(users=total_scores[:5])
+        return TotalScoreResponse(users=total_scores[:limit])
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -250,28 +384,122 @@ async def get_total_scores(
         )
 
 
+async def get_total_scores_batch(
+    data_session: Session,
+    user_session: Session,
+    user_ids: List[uuid.UUID],
+    start: date | None = None,
+    end: date | None = None,
+    max_users: int = 200,
+    shards: ShardSessions | None = None,
+) -> TotalScoreResponse:
+    try:
+        user_ids = list(dict.fromkeys(user_ids))
+        if len(user_ids) > max_users:
+            raise ValueError(f"At most {max_users} users per batch")
+        statement = select(User).where(User.id.in_(user_ids))
+        sharded = shards is not None and len(shards) > 1
+        if not sharded and start is None and end is None and is_colocated(data_session, user_session):
+            # users and their maintained totals in one statement
+            statement = statement.add_columns(UserScore.score).outerjoin(UserScore, UserScore.user_id == User.id)
+            rows = data_session.exec(statement).all()
+            users = {user.id: UserRead.model_validate(user) for user, _ in rows}
+            scores = {user.id: score or 0 for user, score in rows}
+        else:
+            users = {i.id: UserRead.model_validate(i) for i in user_session.exec(statement)}
+            release_connection(user_session)
+            points = get_activity_snapshot().points(data_session)
+
+            def shard_scores(session: Session, ids: list[uuid.UUID]) -> dict[uuid.UUID, int]:
+                if start is None and end is None:
+                    # unbounded totals are maintained in userscore
+                    statement = select(UserScore.user_id, UserScore.score).where(UserScore.user_id.in_(ids))
+                    return dict(session.exec(statement).all())
+                events = tracking_events(user_ids=ids, start=start, end=end)
+                statement = select(events.c.user_id, events.c.activity_id, func.sum(events.c.events)).group_by(
+                    events.c.user_id, events.c.activity_id
+                )
+                scores = defaultdict(int)
+                for user_id, activity_id, count in session.exec(statement):
+                    scores[user_id] += points.get(activity_id, 0) * count
+                return scores
+
+            targets = {data_session: user_ids}
+            if sharded:
+                targets = defaultdict(list)
+                for id in user_ids:
+                    targets[shards.for_user(id)].append(id)
+            parts = await fan_out(list(targets), lambda s: shard_scores(s, targets[s]))
+            scores = {user_id: score for part in parts for user_id, score in part.items()}
+        return TotalScoreResponse(
+            users=[
+                TotalUserScoreResponse(user=users[id], total_score=scores.get(id, 0)) for id in user_ids if id in users
+            ]
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to get total scores: {str(e)}",
+        )
+
+
 # endregion
 
 
 # region update data
+async def _locate_tracking(shards: ShardSessions, id: str) -> tuple[Session, Tracking | None]:
+    # the owner of a tracking row is unknown from its id alone, look it up on every shard
+    select_by_id = get_statements(Tables.Tracking).select_by_id
+    found = await fan_out(shards.all(), lambda s: s.exec(select_by_id, params={"id": id}).one_or_none())
+    return next(((s, i) for s, i in zip(shards.all(), found) if i is not None), (shards.primary, None))
+
+
 async def update_data(
     session: Session,
     table: Tables,
     id: str,
     data: Union[RewardUpdate, ActivityUpdate, TrackingUpdate],
+    shards: ShardSessions | None = None,
 ) -> Reward | Activity | Tracking:
     try:
-        db_data = (await get_data_by_id(session=session, table=table, id=id)).one_or_none()
+        model = get_statements(table).model
+        data = data.model_dump(exclude_none=True)
+        previous_points = None
+        if shards is not None and table == Tables.Tracking:
+            session = (await _locate_tracking(shards, id))[0]
+        if not data:
+            db_data = (await get_data_by_id(session=session, table=table, id=id)).one_or_none()
+        else:
+            if table == Tables.Activity and "points" in data:
+                # the score tables are shifted by the change in points, lock the row to read the old value
+                statement = select(Activity.points).where(Activity.id == id).with_for_update()
+                previous_points = session.exec(statement).one_or_none()
+            statement = update(model).where(model.id == id).values(**data).returning(model)
+            db_data = session.exec(statement).scalar_one_or_none()
         if db_data is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Data not found",
             )
-        data = data.model_dump(exclude_none=True)
-        db_data.sqlmodel_update(data)
-        session.add(db_data)
+        if previous_points is not None:
+            apply_activity_points_change(
+                session=session,
+                activity_id=db_data.id,
+                delta=db_data.points - previous_points,
+            )
+        if table == Tables.Activity:
+            bump_catalog_version(session=session, table=Tables.Activity)
+        if table == Tables.Tracking and data:
+            bump_user_versions(session=session, user_ids={db_data.user_id})
         session.commit()
-        session.refresh(db_data)
+        if shards is not None and len(shards) > 1 and data:
+            if previous_points is not None:
+                shift_replica_scores(shards, {db_data.id: db_data.points - previous_points})
+            if table in CATALOG_TABLES:
+                await replicate_catalog(shards, table, {db_data.id})
+        get_response_cache().invalidate(table)
+        if table == Tables.Activity:
+            get_activity_snapshot().invalidate()
         return db_data
     except IntegrityError as e:
         session.rollback()
@@ -291,29 +519,91 @@ async def update_data(
 
 
 # region delete data
+async def delete_activity_tracking(
+    session: Session,
+    activity_id: str,
+    chunk_size: int,
+) -> int:
+    # delete the tracking fan-out in bounded chunks so a popular activity neither loads
+    # every row into the session nor holds a single giant transaction
+    deleted = 0
+    while True:
+        chunk = select(Tracking.id).where(Tracking.activity_id == activity_id).limit(chunk_size)
+        rows = (
+            delete(Tracking)
+            .where(Tracking.id.in_(chunk))
+            .returning(Tracking.id, Tracking.user_id, Tracking.activity_id, Tracking.added_at)
+            .cte("deleted")
+        )
+        # one statement deletes the chunk and appends its outbox rows, rowcount is the number of deleted rows
+        result = session.exec(record_deleted_tracking(rows))
+        session.commit()
+        deleted += result.rowcount
+        if result.rowcount < chunk_size:
+            return deleted
+
+
+def _delete_remaining_tracking(session: Session, activity_id: str) -> None:
+    # rows added since the chunked delete, removed through the outbox in the transaction that deletes the
+    # activity; the row lock makes new tracking wait on its foreign key, the ON DELETE CASCADE finds nothing
+    session.exec(select(Activity.id).where(Activity.id == activity_id).with_for_update())
+    rows = (
+        delete(Tracking)
+        .where(Tracking.activity_id == activity_id)
+        .returning(Tracking.id, Tracking.user_id, Tracking.activity_id, Tracking.added_at)
+        .cte("deleted")
+    )
+    session.exec(record_deleted_tracking(rows))
+
+
 async def delete_data(
     session: Session,
     table: Tables,
     id: str,
+    chunk_size: int = 10_000,
+    shards: ShardSessions | None = None,
 ) -> DeleteResponse:
     try:
-        match table:
-            case Tables.Rewards:
-                statement = select(Reward).where(Reward.id == id)
-            case Tables.Activity:
-                statement = select(Activity).where(Activity.id == id)
-            case Tables.Tracking:
-                statement = select(Tracking).where(Tracking.id == id)
-            case _:
-                raise ValueError("Invalid table type")
-        db_data = session.exec(statement).one_or_none()
+        if shards is not None and table == Tables.Tracking:
+            session, db_data = await _locate_tracking(shards, id)
+        else:
+            db_data = session.exec(get_statements(table).select_by_id, params={"id": id}).one_or_none()
         if db_data is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Data not found",
             )
+        match table:
+            case Tables.Activity:
+                # not atomic: the score change commits before the chunked tracking delete, and the activity
+                # row only goes after every shard; a failure in between leaves scores that the periodic
+                # score reconciliation rebuilds from the remaining tracking
+                for shard in shards.all() if shards is not None else [session]:
+                    apply_activity_points_change(session=shard, activity_id=id, delta=-db_data.points)
+                    shard.commit()
+                    await delete_activity_tracking(session=shard, activity_id=id, chunk_size=chunk_size)
+                    _delete_remaining_tracking(session=shard, activity_id=id)
+                    if shard is not session:
+                        # replicas drop their copy here, replication would cascade past the outbox
+                        shard.exec(delete(Activity).where(Activity.id == id))
+                        shard.commit()
+                bump_catalog_version(session=session, table=Tables.Activity)
+            case Tables.Tracking:
+                points = lock_activity_points(session, {db_data.activity_id})[db_data.activity_id]
+                apply_score_deltas(session=session, deltas={db_data.user_id: -points})
+                record_tracking_changes(session=session, operation=ChangeOperations.Deleted, rows=[db_data])
+                bump_user_versions(session=session, user_ids={db_data.user_id})
+        # the activity -> tracking relationship uses passive_deletes, the tracking rows are already gone
+        # through the outbox and the ON DELETE CASCADE foreign key only backs that up
         session.delete(db_data)
         session.commit()
+        if shards is not None and table in CATALOG_TABLES:
+            await replicate_catalog(shards, table, {str_to_uuid(id)})
+        get_count_cache().invalidate(table)
+        get_response_cache().invalidate(table)
+        if table == Tables.Activity:
+            get_count_cache().invalidate(Tables.Tracking)
+            get_activity_snapshot().invalidate()
         return DeleteResponse(
             id=id,
             message="Data deleted successfully",
@@ -0,0 +1,222 @@
+import codecs
+import csv
+import io
+import json
+from typing import AsyncIterator
+
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy import column, literal_column, table, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, select
+
+from src.enums.ImportFormats import ImportFormats
+from src.enums.Tables import Tables
+from src.schemas.CatalogImportResponse import CatalogImportResponse, RejectedRow
+from src.services.compression import get_response_cache
+from src.services.data_database.shards import ShardSessions, replicate_catalog
+from src.services.data_database.tables import Activity, ActivityCreate, Reward, RewardCreate
+
+from .catalog import bump_catalog_version, get_activity_snapshot
+from .counts import get_count_cache
+from .data import shift_replica_scores
+from .scores import apply_activity_points_change
+
+IMPORT_MODELS = {Tables.Rewards: (Reward, RewardCreate), Tables.Activity: (Activity, ActivityCreate)}
+# rejected rows listed in the response, the rest is only counted
+MAX_REPORTED_ERRORS = 100
+STAGING_TABLE = "catalog_import"
+# a csv row spanning lines is buffered until its quotes close, a stray quote must not buffer the whole upload
+MAX_RECORD_CHARS = 65_536
+staging = table(STAGING_TABLE, column("line"), column("name"), column("points"))
+
+
+# region parsing
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[tuple[int, str]]:
+    # decoded incrementally, a multi-byte character or a line may be split across chunks; line endings are
+    # kept, a quoted csv field may span lines and keeps its own
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    number = 0
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            number += 1
+            yield number, line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield number + 1, pending
+
+
+def _strip_ending(line: str) -> str:
+    return line.removesuffix("\n").removesuffix("\r")
+
+
+async def _records(chunks: AsyncIterator[bytes], format: ImportFormats) -> AsyncIterator[tuple[int, dict | str]]:
+    # one record per line, or per csv row spanning lines; a record that can't be read is handed on as the
+    # reason it was rejected, under the number of its first line
+    header = None
+    record, start = "", 0
+    async for number, line in _lines(chunks):
+        if not record and not line.strip():
+            continue
+        if format == ImportFormats.Ndjson:
+            try:
+                data = json.loads(line)
+            except ValueError as e:
+                yield number, f"invalid json: {e}"
+                continue
+            yield number, data if isinstance(data, dict) else "expected a json object"
+            continue
+        if not record:
+            start = number
+        record += line
+        # an odd number of quotes leaves a quoted field open, its row continues on the next line
+        if record.count('"') % 2:
+            if len(record) > MAX_RECORD_CHARS:
+                yield start, f"quoted field not closed within {MAX_RECORD_CHARS} characters"
+                record = ""
+            continue
+        values = next(csv.reader([_strip_ending(record)]))
+        record = ""
+        if header is None:
+            header = [i.strip() for i in values]
+            continue
+        if len(values) != len(header):
+            yield start, f"expected {len(header)} columns, got {len(values)}"
+            continue
+        yield start, dict(zip(header, values))
+    if record:
+        yield start, "unterminated quoted field"
+
+
+# endregion
+
+
+# region staging
+def _create_staging(session: Session, model) -> None:
+    # dropped with the transaction, so it also works behind a transaction pooler
+    session.exec(
+        text(
+            f"CREATE TEMP TABLE {STAGING_TABLE} ON COMMIT DROP AS "
+            f"SELECT 0 AS line, name, points FROM {model.__tablename__} WITH NO DATA"
+        )
+    )
+
+
+def _copy_rows(session: Session, rows: list[tuple[int, str, int]]) -> None:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    # COPY goes through the driver's cursor, on the connection and in the transaction of the session
+    cursor = session.connection().connection.cursor()
+    try:
+        cursor.execute(f"COPY {STAGING_TABLE} (line, name, points) FROM STDIN WITH (FORMAT csv)", stream=buffer)
+    finally:
+        cursor.close()
+
+
+def _upsert_staged(session: Session, model) -> tuple[int, int, dict, set]:
+    previous_points = {}
+    if model is Activity:
+        # the score tables are shifted by the change in points, lock the rows to read the old values
+        statement = select(Activity.id, Activity.points).where(Activity.name.in_(select(staging.c.name)))
+        previous_points = dict(session.exec(statement.with_for_update()).all())
+    # a name repeated in the import is taken from its last row, an upsert can't touch the same row twice
+    latest = (
+        select(staging.c.name, staging.c.points)
+        .distinct(staging.c.name)
+        .order_by(staging.c.name, staging.c.line.desc())
+    )
+    statement = pg_insert(model).from_select(["name", "points"], latest)
+    rows = session.exec(
+        statement.on_conflict_do_update(
+            index_elements=[model.name],
+            set_={"points": statement.excluded.points},
+            # unchanged rows are not rewritten and not returned
+            where=model.points.is_distinct_from(statement.excluded.points),
+        ).returning(model.id, model.points, literal_column("xmax = 0").label("inserted"))
+    ).all()
+    inserted = sum(1 for row in rows if row.inserted)
+    deltas = {row.id: row.points - previous_points.get(row.id, row.points) for row in rows if not row.inserted}
+    return inserted, len(rows) - inserted, deltas, {row.id for row in rows}
+
+
+# endregion
+
+
+# region import
+async def import_catalog(
+    shards: ShardSessions,
+    table: Tables,
+    chunks: AsyncIterator[bytes],
+    format: ImportFormats,
+    batch_rows: int,
+) -> CatalogImportResponse:
+    session = shards.primary
+    try:
+        if table not in IMPORT_MODELS:
+            raise ValueError(f"{table} is not a catalog")
+        model, create_model = IMPORT_MODELS[table]
+        _create_staging(session, model)
+        errors: list[RejectedRow] = []
+        rejected = 0
+        seen: dict[str, int] = {}
+        batch: list[tuple[int, str, int]] = []
+
+        def reject(line: int, detail: str) -> None:
+            nonlocal rejected
+            rejected += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append(RejectedRow(line=line, detail=detail))
+
+        async for line, record in _records(chunks, format):
+            if isinstance(record, str):
+                reject(line, record)
+                continue
+            try:
+                data = create_model.model_validate(record)
+            except ValidationError as e:
+                error = e.errors()[0]
+                reject(line, f"{'.'.join(str(i) for i in error['loc'])}: {error['msg']}")
+                continue
+            if data.name in seen:
+                reject(seen[data.name], f"name repeated on line {line}, the later row is imported")
+            seen[data.name] = line
+            batch.append((line, data.name, data.points))
+            if len(batch) >= batch_rows:
+                _copy_rows(session, batch)
+                batch = []
+        if batch:
+            _copy_rows(session, batch)
+        inserted, updated, deltas, changed = _upsert_staged(session, model) if seen else (0, 0, {}, set())
+        for activity_id, delta in deltas.items():
+            apply_activity_points_change(session=session, activity_id=activity_id, delta=delta)
+        if model is Activity and (inserted or updated):
+            bump_catalog_version(session=session, table=Tables.Activity)
+        session.commit()
+        if inserted or updated:
+            if len(shards) > 1:
+                shift_replica_scores(shards, deltas)
+                await replicate_catalog(shards, table, changed)
+            get_count_cache().invalidate(table)
+            get_response_cache().invalidate(table)
+            if model is Activity:
+                get_activity_snapshot().invalidate()
+        return CatalogImportResponse(
+            inserted=inserted,
+            updated=updated,
+            unchanged=len(seen) - inserted - updated,
+            rejected=rejected,
+            errors=errors,
+        )
+    except Exception as e:
+        session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to import data: {str(e)}",
+        )
+
+
+# endregion
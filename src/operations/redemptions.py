@@ -0,0 +1,98 @@
+import uuid
+
+from fastapi import HTTPException, status
+from sqlalchemy import func, insert, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, select
+
+from src.schemas.BalanceResponse import BalanceResponse
+from src.schemas.RedemptionResponse import RedemptionResponse
+from src.services.data_database.tables import Redemption, RedemptionRead, Reward, UserBalance, UserScore
+
+
+# region balance
+def _read_balance(session: Session, user_id: uuid.UUID) -> tuple[int, int, int]:
+    # score, spent and version from the maintained rows, a user without them has 0 of each
+    score = select(UserScore.score).where(UserScore.user_id == user_id)
+    spent = select(UserBalance.spent).where(UserBalance.user_id == user_id)
+    version = select(UserBalance.version).where(UserBalance.user_id == user_id)
+    return session.exec(
+        select(
+            func.coalesce(score.scalar_subquery(), 0),
+            func.coalesce(spent.scalar_subquery(), 0),
+            func.coalesce(version.scalar_subquery(), 0),
+        )
+    ).one()
+
+
+async def get_balance(session: Session, user_id: uuid.UUID) -> BalanceResponse:
+    try:
+        score, spent, _ = _read_balance(session, user_id)
+        return BalanceResponse(user_id=user_id, score=score, spent=spent, available=score - spent)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to get balance: {str(e)}",
+        )
+
+
+# endregion
+
+
+# region redeem
+async def redeem_reward(
+    session: Session,
+    user_id: uuid.UUID,
+    reward_id: uuid.UUID,
+    max_retries: int,
+) -> RedemptionResponse:
+    try:
+        cost = session.exec(select(Reward.points).where(Reward.id == reward_id)).one_or_none()
+        if cost is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Reward not found",
+            )
+        session.exec(pg_insert(UserBalance).values(user_id=user_id).on_conflict_do_nothing())
+        for _ in range(max_retries):
+            score, spent, version = _read_balance(session, user_id)
+            if score - spent < cost:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"Insufficient points: {score - spent} available, the reward costs {cost}",
+                )
+            # no lock is held between the read and the debit, the debit only applies when no other
+            # redemption of the user came in between; tracking and the score rows are never locked
+            debited = session.exec(
+                update(UserBalance)
+                .where(UserBalance.user_id == user_id, UserBalance.version == version)
+                .values(spent=UserBalance.spent + cost, version=UserBalance.version + 1)
+            ).rowcount
+            if debited:
+                break
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Balance changed by concurrent redemptions, try again",
+            )
+        redemption = session.exec(
+            insert(Redemption).returning(Redemption),
+            params=[{"user_id": user_id, "reward_id": reward_id, "points": cost}],
+        ).scalar_one()
+        session.commit()
+        return RedemptionResponse(
+            redemption=RedemptionRead.model_validate(redemption),
+            balance=BalanceResponse(user_id=user_id, score=score, spent=spent + cost, available=score - spent - cost),
+        )
+    except HTTPException:
+        session.rollback()
+        raise
+    except Exception as e:
+        session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to redeem reward: {str(e)}",
+        )
+
+
+# endregion
@@ -0,0 +1,498 @@
+import asyncio
+import uuid
+from collections import defaultdict
+from itertools import chain
+from datetime import date, timedelta
+
+from fastapi import HTTPException, status
+from sqlalchemy import Date, Engine, Float, and_, cast, delete, func, insert, literal_column, or_, text, union_all, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, select
+
+from src.enums.ScoreGroups import ScoreGroups
+from src.logging import logger
+from src.schemas.GroupLeaderboardResponse import GroupLeaderboardResponse, GroupScoreResponse
+from src.schemas.UserRankResponse import RankedUserScore, UserRankResponse
+from src.services.data_database.engine import get_shard_router
+from src.services.data_database.shards import ShardSessions, fan_out
+from src.services.data_database.tables import (
+    Activity,
+    GroupScore,
+    GroupScoreDelta,
+    Tracking,
+    TrackingRollup,
+    UserScore,
+)
+from src.services.pool import release_connection
+from src.services.user_database.engine import DatabaseEngine as UserDatabaseEngine
+from src.services.user_database.tables import User, UserInDB, UserRead
+from src.settings import Settings
+from src.utils import batched
+
+
+# region co-location
+def is_colocated(data_session: Session, user_session: Session) -> bool:
+    # with Settings.colocated_databases both sessions share one engine and user tables can be joined in SQL
+    return data_session.get_bind() is user_session.get_bind()
+
+
+# endregion
+
+
+# region events
+def tracking_events(
+    user_id: uuid.UUID | None = None,
+    start: date | None = None,
+    end: date | None = None,
+    user_ids: list[uuid.UUID] | None = None,
+):
+    # live tracking rows plus the daily counts folded into the rollup by the retention policy,
+    # with the date bounds applied on both sides so postgres can prune tracking partitions
+    live = select(
+        Tracking.user_id,
+        Tracking.activity_id,
+        cast(Tracking.added_at, Date).label("day"),
+        literal_column("1").label("events"),
+    )
+    folded = select(
+        TrackingRollup.user_id,
+        TrackingRollup.activity_id,
+        TrackingRollup.day,
+        TrackingRollup.events,
+    )
+    if user_id is not None:
+        live = live.where(Tracking.user_id == user_id)
+        folded = folded.where(TrackingRollup.user_id == user_id)
+    if user_ids is not None:
+        live = live.where(Tracking.user_id.in_(user_ids))
+        folded = folded.where(TrackingRollup.user_id.in_(user_ids))
+    if start is not None:
+        live = live.where(Tracking.added_at >= start)
+        folded = folded.where(TrackingRollup.day >= start)
+    if end is not None:
+        live = live.where(Tracking.added_at < end + timedelta(days=1))
+        folded = folded.where(TrackingRollup.day <= end)
+    return union_all(live, folded).subquery("events")
+
+
+# endregion
+
+
+# region maintain aggregates
+def _group_names(team_name: str | None, user_country: str | None) -> dict[ScoreGroups, str | None]:
+    return {ScoreGroups.Team: team_name, ScoreGroups.Country: user_country}
+
+
+def apply_group_deltas(
+    session: Session,
+    deltas: dict[tuple[ScoreGroups, str], int],
+) -> None:
+    # appended inside the caller's transaction, fold_group_scores moves them into GroupScore
+    rows = [{"kind": kind.value, "name": name, "score": delta} for (kind, name), delta in deltas.items() if delta]
+    if not rows:
+        return
+    session.exec(insert(GroupScoreDelta).values(rows))
+
+
+def fold_group_scores(session: Session) -> int:
+    # one statement takes the committed deltas and adds their sums to the group rows; a concurrent fold skips
+    # the rows this one deleted, so no delta is counted twice
+    moved = (
+        delete(GroupScoreDelta)
+        .returning(GroupScoreDelta.kind, GroupScoreDelta.name, GroupScoreDelta.score)
+        .cte("moved")
+    )
+    statement = pg_insert(GroupScore).from_select(
+        ["kind", "name", "score"],
+        select(moved.c.kind, moved.c.name, func.sum(moved.c.score))
+        .group_by(moved.c.kind, moved.c.name)
+        .order_by(moved.c.kind, moved.c.name),
+    )
+    folded = session.exec(
+        statement.on_conflict_do_update(
+            index_elements=[GroupScore.kind, GroupScore.name],
+            set_={"score": GroupScore.score + statement.excluded.score},
+        ).add_cte(moved)
+    ).rowcount
+    session.commit()
+    return folded
+
+
+def apply_score_deltas(
+    session: Session,
+    deltas: dict[uuid.UUID, int],
+    users: dict[uuid.UUID, UserInDB] | None = None,
+) -> None:
+    # runs inside the caller's transaction as one multi-row upsert; team and country are refreshed when
+    # the caller knows the users (tracking adds) and taken from the stored rows otherwise (deletes); sorted
+    # by user so concurrent batches lock the rows in the same order instead of deadlocking
+    rows = [
+        {
+            "user_id": user_id,
+            "score": delta,
+            "team_name": users[user_id].team_name if users else None,
+            "user_country": users[user_id].user_country if users else None,
+        }
+        for user_id, delta in sorted(deltas.items())
+    ]
+    if not rows:
+        return
+    statement = pg_insert(UserScore).values(rows)
+    update_set = {"score": UserScore.score + statement.excluded.score}
+    if users is not None:
+        update_set |= {"team_name": statement.excluded.team_name, "user_country": statement.excluded.user_country}
+    statement = statement.on_conflict_do_update(index_elements=[UserScore.user_id], set_=update_set)
+    statement = statement.returning(UserScore.user_id, UserScore.team_name, UserScore.user_country)
+    group_deltas = defaultdict(int)
+    for user_id, team_name, user_country in session.exec(statement).all():
+        for kind, name in _group_names(team_name, user_country).items():
+            if name:
+                group_deltas[(kind, name)] += deltas[user_id]
+    apply_group_deltas(session=session, deltas=group_deltas)
+
+
+def apply_activity_points_change(
+    session: Session,
+    activity_id: uuid.UUID,
+    delta: int,
+) -> None:
+    # shift every user that logged the activity by delta points per event in one UPDATE ... FROM
+    if delta == 0:
+        return
+    events = tracking_events()
+    counts = (
+        select(events.c.user_id, func.sum(events.c.events).label("events"))
+        .where(events.c.activity_id == activity_id)
+        .group_by(events.c.user_id)
+        .subquery("counts")
+    )
+    user_delta = (counts.c.events * delta).label("delta")
+    rows = session.exec(
+        update(UserScore)
+        .where(UserScore.user_id == counts.c.user_id)
+        .values(score=UserScore.score + counts.c.events * delta)
+        .returning(UserScore.team_name, UserScore.user_country, user_delta)
+    ).all()
+    group_deltas = defaultdict(int)
+    for team_name, user_country, change in rows:
+        for kind, name in _group_names(team_name, user_country).items():
+            if name:
+                group_deltas[(kind, name)] += change
+    apply_group_deltas(session=session, deltas=group_deltas)
+
+
+# endregion
+
+
+# region reconcile
+# rows per upsert, kept well below the 65535 bind parameters postgres allows in one statement
+RECONCILE_BATCH_ROWS = 1000
+
+
+def _score_corrections(
+    data_session: Session,
+    user_session: Session,
+) -> tuple[list[dict], set[uuid.UUID], set[uuid.UUID]]:
+    # the totals and the stored rows are read by one statement, so both come from the same snapshot; a write
+    # after it moves both by the same delta and the difference stays a valid correction
+    events = tracking_events()
+    totals = (
+        select(events.c.user_id, func.sum(events.c.events * Activity.points).label("score"))
+        .join(Activity, Activity.id == events.c.activity_id)
+        .group_by(events.c.user_id)
+        .subquery("totals")
+    )
+    stored = select(UserScore).subquery("stored")
+    rows = data_session.exec(
+        select(
+            func.coalesce(totals.c.user_id, stored.c.user_id),
+            totals.c.score,
+            stored.c.score,
+            stored.c.team_name,
+            stored.c.user_country,
+        ).select_from(totals.outerjoin(stored, stored.c.user_id == totals.c.user_id, full=True))
+    ).all()
+    users = user_session.exec(select(User.id, User.team_name, User.user_country)).all()
+    users = {id: (team_name, user_country) for id, team_name, user_country in users}
+    corrections, untracked, unknown = [], set(), set()
+    for user_id, total, score, team_name, user_country in rows:
+        if user_id not in users:
+            unknown.add(user_id)
+            continue
+        drift = (total or 0) - (score or 0)
+        if total is None:
+            untracked.add(user_id)
+        if drift or score is None or (team_name, user_country) != users[user_id]:
+            team_name, user_country = users[user_id]
+            corrections.append(
+                {"user_id": user_id, "score": drift, "team_name": team_name, "user_country": user_country}
+            )
+    return sorted(corrections, key=lambda i: i["user_id"]), untracked, unknown
+
+
+def reconcile_scores(
+    data_session: Session,
+    user_session: Session,
+) -> int:
+    try:
+        corrections, untracked, unknown = _score_corrections(data_session, user_session)
+        data_session.commit()
+        # the full aggregation ran without a lock, score writers only wait for the corrections and the
+        # group rebuild from the user rows
+        tables = ", ".join(i.__tablename__ for i in (UserScore, GroupScore, GroupScoreDelta))
+        data_session.exec(text(f"LOCK TABLE {tables} IN EXCLUSIVE MODE"))
+        for batch in batched(corrections, RECONCILE_BATCH_ROWS):
+            statement = pg_insert(UserScore).values(batch)
+            data_session.exec(
+                statement.on_conflict_do_update(
+                    index_elements=[UserScore.user_id],
+                    set_={
+                        "score": UserScore.score + statement.excluded.score,
+                        "team_name": statement.excluded.team_name,
+                        "user_country": statement.excluded.user_country,
+                    },
+                )
+            )
+        for batch in batched(sorted(unknown), RECONCILE_BATCH_ROWS):
+            data_session.exec(delete(UserScore).where(UserScore.user_id.in_(batch)))
+        # users without any tracking lose their row, unless they logged something since the snapshot
+        for batch in batched(sorted(untracked), RECONCILE_BATCH_ROWS):
+            data_session.exec(delete(UserScore).where(UserScore.user_id.in_(batch), UserScore.score == 0))
+        # the pending group deltas are already part of the user rows the groups are rebuilt from
+        data_session.exec(delete(GroupScoreDelta))
+        data_session.exec(delete(GroupScore))
+        for kind, column in [(ScoreGroups.Team, UserScore.team_name), (ScoreGroups.Country, UserScore.user_country)]:
+            data_session.exec(
+                insert(GroupScore).from_select(
+                    ["kind", "name", "score"],
+                    select(literal_column(f"'{kind.value}'"), column, func.sum(UserScore.score))
+                    .where(column.is_not(None))
+                    .group_by(column),
+                )
+            )
+        data_session.commit()
+        return len(corrections) + len(unknown)
+    except Exception as e:
+        data_session.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to reconcile scores: {str(e)}",
+        )
+
+
+def _reconcile_shard(engine: Engine, settings: Settings) -> int:
+    with Session(engine) as data_session, Session(UserDatabaseEngine(settings).engine) as user_session:
+        return reconcile_scores(data_session=data_session, user_session=user_session)
+
+
+async def run_periodic_reconciliation(settings: Settings) -> None:
+    while True:
+        await asyncio.sleep(settings.score_reconcile_interval_seconds)
+        try:
+            reconciled = 0
+            # every shard holds the scores of its own users, they are reconciled one shard at a time in a
+            # worker thread, the aggregation would otherwise stall the event loop
+            for engine in get_shard_router(settings).engines:
+                reconciled += await asyncio.to_thread(_reconcile_shard, engine, settings)
+            logger.info(f"reconciled scores, corrected {reconciled} users")
+        except Exception as e:
+            logger.error(f"score reconciliation failed: {e}")
+
+
+def _fold_shard(engine: Engine) -> int:
+    with Session(engine) as session:
+        return fold_group_scores(session=session)
+
+
+async def run_periodic_group_fold(settings: Settings) -> None:
+    # group leaderboards lag behind tracking writes by up to one interval
+    while True:
+        await asyncio.sleep(settings.group_score_fold_interval_seconds)
+        for engine in get_shard_router(settings).engines:
+            try:
+                await asyncio.to_thread(_fold_shard, engine)
+            except Exception as e:
+                logger.error(f"folding group scores on {engine.url.database} failed: {e}")
+
+
+# endregion
+
+
+# region leaderboards
+async def get_group_leaderboard(
+    data_session: Session,
+    user_session: Session,
+    group: ScoreGroups,
+    per_capita: bool = False,
+    limit: int = 10,
+    shards: ShardSessions | None = None,
+) -> GroupLeaderboardResponse:
+    try:
+        column = User.team_name if group == ScoreGroups.Team else User.user_country
+        sharded = shards is not None and len(shards) > 1
+        if not sharded and is_colocated(data_session, user_session):
+            return _get_group_leaderboard_joined(data_session, group, column, per_capita, limit)
+        members = dict(
+            user_session.exec(select(column, func.count()).where(column.is_not(None)).group_by(column)).all()
+        )
+        release_connection(user_session)
+        statement = select(GroupScore.name, GroupScore.score).where(GroupScore.kind == group.value)
+        if sharded:
+            # every shard holds the partial sums of its own users, one row per group each
+            scores = defaultdict(int)
+            for name, score in chain(*await fan_out(shards.all(), lambda s: s.exec(statement).all())):
+                scores[name] += score
+            rows = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+            if not per_capita:
+                rows = rows[:limit]
+        else:
+            if not per_capita:
+                statement = statement.order_by(GroupScore.score.desc()).limit(limit)
+            rows = data_session.exec(statement).all()
+        groups = [
+            GroupScoreResponse(
+                name=name,
+                total_score=score,
+                members=members.get(name, 0),
+                per_capita_score=score / members[name] if members.get(name) else 0.0,
+            )
+            for name, score in rows
+        ]
+        if per_capita:
+            # the group table holds one row per team / country, ranking it in memory stays cheap
+            groups.sort(key=lambda x: x.per_capita_score, reverse=True)
+            groups = groups[:limit]
+        return GroupLeaderboardResponse(group=group, per_capita=per_capita, groups=groups)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to get leaderboard: {str(e)}",
+        )
+
+
+def _get_group_leaderboard_joined(
+    session: Session,
+    group: ScoreGroups,
+    column,
+    per_capita: bool,
+    limit: int,
+) -> GroupLeaderboardResponse:
+    # member counts, scores and the per capita ranking in one statement
+    members = (
+        select(column.label("name"), func.count().label("members"))
+        .where(column.is_not(None))
+        .group_by(column)
+        .subquery("members")
+    )
+    member_count = func.coalesce(members.c.members, 0)
+    per_capita_score = func.coalesce(cast(GroupScore.score, Float) / func.nullif(members.c.members, 0), 0.0)
+    statement = (
+        select(GroupScore.name, GroupScore.score, member_count, per_capita_score)
+        .outerjoin(members, members.c.name == GroupScore.name)
+        .where(GroupScore.kind == group.value)
+        .order_by(per_capita_score.desc() if per_capita else GroupScore.score.desc())
+        .limit(limit)
+    )
+    groups = [
+        GroupScoreResponse(name=name, total_score=score, members=count, per_capita_score=score_per_member)
+        for name, score, count, score_per_member in session.exec(statement).all()
+    ]
+    return GroupLeaderboardResponse(group=group, per_capita=per_capita, groups=groups)
+
+
+# endregion
+
+
+# region rank
+# neighbors on either side of the user, each of their scores adds a column to the rank query
+MAX_RANK_NEIGHBORS = 25
+
+
+def _count_above(session: Session, scores: list[int]) -> tuple[int, ...]:
+    # one pass over userscore for every score at once: the ranked users, then per score the users above it;
+    # FILTER rather than a window over the shard's own scores, a score may not exist on every shard
+    statement = select(
+        func.count(),
+        *(func.count().filter(UserScore.score > score) for score in scores),
+    ).select_from(UserScore)
+    return tuple(session.exec(statement).one())
+
+
+async def _ranks(sessions: list[Session], scores: set[int]) -> tuple[int, dict[int, int]]:
+    # competition ranking, counts of every shard are summed; also returns the number of ranked users
+    scores = sorted(scores)
+    counts = [sum(i) for i in zip(*await fan_out(sessions, lambda s: _count_above(s, scores)))]
+    return counts[0], {score: above + 1 for score, above in zip(scores, counts[1:])}
+
+
+async def get_user_rank(
+    data_session: Session,
+    user_session: Session,
+    user_id: uuid.UUID,
+    neighbors: int = 2,
+    shards: ShardSessions | None = None,
+) -> UserRankResponse:
+    try:
+        user = user_session.get(User, user_id)
+        if user is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="User not found",
+            )
+        release_connection(user_session)
+        neighbors = min(max(neighbors, 0), MAX_RANK_NEIGHBORS)
+        # with shards, data_session is the user's own shard
+        sessions = shards.all() if shards is not None else [data_session]
+        stored = data_session.exec(select(UserScore.score).where(UserScore.user_id == user_id)).one_or_none()
+        score = stored or 0
+        # neighbors in leaderboard order (score desc, user_id asc), read from either side of the user's position
+        above_statement = (
+            select(UserScore.user_id, UserScore.score)
+            .where(or_(UserScore.score > score, and_(UserScore.score == score, UserScore.user_id < user_id)))
+            .order_by(UserScore.score.asc(), UserScore.user_id.desc())
+            .limit(neighbors)
+        )
+        below_statement = (
+            select(UserScore.user_id, UserScore.score)
+            .where(or_(UserScore.score < score, and_(UserScore.score == score, UserScore.user_id > user_id)))
+            .order_by(UserScore.score.desc(), UserScore.user_id.asc())
+            .limit(neighbors)
+        )
+        colocated = len(sessions) == 1 and is_colocated(data_session, user_session)
+        if colocated:
+            # neighbors come back together with their user rows
+            above_statement = above_statement.join(User, User.id == UserScore.user_id).add_columns(User)
+            below_statement = below_statement.join(User, User.id == UserScore.user_id).add_columns(User)
+        # the closest neighbors of every shard, merged back into leaderboard order
+        above = chain(*await fan_out(sessions, lambda s: s.exec(above_statement).all()))
+        below = chain(*await fan_out(sessions, lambda s: s.exec(below_statement).all()))
+        above = sorted(above, key=lambda row: (-row[1], row[0]), reverse=True)[:neighbors][::-1]
+        below = sorted(below, key=lambda row: (-row[1], row[0]))[:neighbors]
+        # ranks and percentile over one population, the users with a score plus the user if it has none yet
+        total_users, ranks = await _ranks(sessions, {row[1] for row in above + below} | {score})
+        total_users += stored is None
+        rank = ranks[score]
+        if colocated:
+            users = {row[0]: UserRead.model_validate(row[2]) for row in above + below}
+        else:
+            users = {
+                i.id: UserRead.model_validate(i)
+                for i in user_session.exec(select(User).where(User.id.in_([row[0] for row in above + below])))
+            }
+        return UserRankResponse(
+            user=UserRead.model_validate(user),
+            total_score=score,
+            rank=rank,
+            percentile=round(100 * (total_users - rank + 1) / total_users, 2) if total_users else 0.0,
+            total_users=total_users,
+            above=[RankedUserScore(user=users[id], total_score=s, rank=ranks[s]) for id, s, *_ in above if id in users],
+            below=[RankedUserScore(user=users[id], total_score=s, rank=ranks[s]) for id, s, *_ in below if id in users],
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Failed to get rank: {str(e)}",
+        )
+
+
+# endregion
@@ -0,0 +1,125 @@
+import asyncio
+from collections import defaultdict
+
+from sqlalchemy import Engine, insert
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import Session
+
+from src.logging import logger
+from src.services.deadline import current_deadline
+from src.services.data_database.tables import Tracking, TrackingCreate
+from src.services.user_database.tables import UserInDB
+
+from src.enums.ChangeOperations import ChangeOperations
+
+from .catalog import get_activity_snapshot, lock_activity_points
+from .changes import record_tracking_changes
+from .scores import apply_score_deltas
+from .versions import bump_user_versions
+
+
+# region insert
+def insert_tracking(
+    session: Session,
+    items: list[tuple[TrackingCreate, UserInDB]],
+) -> list[Tracking]:
+    # one multi-row INSERT ... RETURNING plus one score upsert for the whole list, inside the caller's transaction
+    activity_ids = {data.activity_id for data, _ in items}
+    points = lock_activity_points(session, activity_ids)
+    # the snapshot only provides the activity objects of the response
+    activities = get_activity_snapshot().require(session, activity_ids)
+    rows = [data.model_dump() | {"user_id": user.id} for data, user in items]
+    inserted = defaultdict(list)
+    db_rows = session.exec(insert(Tracking).returning(Tracking), params=rows).scalars().all()
+    for db_data in db_rows:
+        set_committed_value(db_data, "activity", activities[db_data.activity_id])
+        inserted[(db_data.user_id, db_data.activity_id)].append(db_data)
+    record_tracking_changes(session=session, operation=ChangeOperations.Created, rows=db_rows)
+    deltas = defaultdict(int)
+    for data, user in items:
+        deltas[user.id] += points[data.activity_id]
+    apply_score_deltas(session=session, deltas=deltas, users={user.id: user for _, user in items})
+    bump_user_versions(session=session, user_ids=set(deltas))
+    # RETURNING order is not guaranteed for multi-row inserts, rows are interchangeable per (user, activity)
+    return [inserted[(user.id, data.activity_id)].pop() for data, user in items]
+
+
+# endregion
+
+
+# region group commit
+class TrackingBatcher:
+    """Collect tracking inserts of concurrent requests for up to max_delay seconds and write them in one transaction."""
+
+    def __init__(self, engine: Engine, max_batch_size: int, max_delay: float) -> None:
+        self.engine = engine
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self._pending: list[tuple[TrackingCreate, UserInDB, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._flushes: set[asyncio.Task] = set()
+
+    async def submit(self, data: TrackingCreate, user: UserInDB) -> Tracking:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((data, user, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    async def drain(self) -> None:
+        # on shutdown, write what still waits on the timer and let the running writes finish
+        self._flush()
+        await asyncio.gather(*self._flushes, return_exceptions=True)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._write(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _write(self, batch: list[tuple[TrackingCreate, UserInDB, asyncio.Future]]) -> None:
+        try:
+            results = await asyncio.to_thread(self._write_batch, [(data, user) for data, user, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _write_batch(self, items: list[tuple[TrackingCreate, UserInDB]]) -> list[Tracking | Exception]:
+        # the batch is shared by several requests, none of their deadlines applies to it
+        current_deadline.set(None)
+        with Session(self.engine, expire_on_commit=False) as session:
+            try:
+                rows = insert_tracking(session=session, items=items)
+                session.commit()
+                return rows
+            except Exception as e:
+                session.rollback()
+                if len(items) == 1:
+                    return [e]
+                logger.warning(f"group commit of {len(items)} tracking rows failed, retrying row by row: {e}")
+            # isolate the failing rows with savepoints so every request gets its own row or error
+            results = []
+            for item in items:
+                try:
+                    with session.begin_nested():
+                        results.extend(insert_tracking(session=session, items=[item]))
+                except Exception as e:
+                    results.append(e)
+            session.commit()
+            return results
+
+
+# endregion
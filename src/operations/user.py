@@ -1,8 +1,12 @@
 from typing import List
 
 import bcrypt
+from fastapi_pagination import Page, Params
+from sqlalchemy import func
+from sqlalchemy import select as select_rows
 from sqlmodel import Session, select
 
+from src.services.fieldsets import sparse_model
 from src.services.user_database.tables import User, UserCreate, UserInDB, UserRead
 
 
@@ -41,3 +45,22 @@ async def get_users(
     statement = select(User)
     result = session.exec(statement)
     return [UserRead.model_validate(user) for user in result]
+
+
+async def get_users_page(
+    session: Session,
+    fields: tuple[str, ...],
+    params: Params,
+) -> Page:
+    # only the requested columns of one page are read, the rows are trusted and not validated again
+    model = sparse_model(UserRead, fields)
+    raw_params = params.to_raw_params()
+    statement = (
+        select_rows(*(getattr(User, i) for i in fields))
+        .order_by(User.id)
+        .limit(raw_params.limit)
+        .offset(raw_params.offset)
+    )
+    items = [model.model_construct(**row._mapping) for row in session.execute(statement)]
+    total = session.execute(select_rows(func.count()).select_from(User)).scalar_one()
+    return Page[model].create(items, params, total=total)
@@ -0,0 +1,56 @@
+import hashlib
+import uuid
+from datetime import datetime
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, select
+
+from src.services.data_database.tables import UserDataVersion
+from src.services.user_database.tables import User, UserRead
+
+from .catalog import get_activity_snapshot
+
+
+# region bump
+def bump_user_versions(session: Session, user_ids: set[uuid.UUID]) -> None:
+    # inside the caller's transaction, a new version is only visible together with the tracking write
+    if not user_ids:
+        return
+    statement = pg_insert(UserDataVersion).values([{"user_id": id, "version": 1} for id in sorted(user_ids)])
+    session.exec(
+        statement.on_conflict_do_update(
+            index_elements=[UserDataVersion.user_id],
+            set_={"version": UserDataVersion.version + 1, "changed_at": func.timezone("utc", func.now())},
+        )
+    )
+
+
+# endregion
+
+
+# region stamp
+def _user_row_version(user_session: Session, user_id: uuid.UUID) -> str:
+    # the responses embed the user, a digest of its fields changes with any profile update, also one made
+    # outside this service, and needs no version column on the users table
+    columns = [getattr(User, i) for i in UserRead.model_fields]
+    row = user_session.exec(select(*columns).where(User.id == user_id)).one_or_none()
+    return hashlib.blake2b(repr(tuple(row) if row else None).encode("utf-8"), digest_size=6).hexdigest()
+
+
+def get_user_data_stamp(
+    session: Session,
+    user_session: Session,
+    user_id: uuid.UUID,
+) -> tuple[str, datetime | None]:
+    # the user's tracking version, the version of the activity snapshot the totals are computed from and the
+    # version of the user row; the snapshot may lag the catalog, an etag with the catalog's version could
+    # then vouch for old totals
+    statement = select(UserDataVersion.version, UserDataVersion.changed_at).where(UserDataVersion.user_id == user_id)
+    version, last_modified = session.exec(statement).one_or_none() or (0, None)
+    snapshot = get_activity_snapshot()
+    snapshot.get(session)
+    return f'"{version}.{snapshot.version}.{_user_row_version(user_session, user_id)}"', last_modified
+
+
+# endregion
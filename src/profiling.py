@@ -0,0 +1,198 @@
+import sys
+import threading
+import uuid
+from collections import Counter, OrderedDict
+from datetime import UTC, datetime
+from functools import lru_cache
+from urllib.parse import parse_qs
+
+from fastapi import Depends, HTTPException, Request, status
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.enums.ProfileFormats import ProfileFormats
+from src.enums.Roles import Roles
+from src.logging import logger
+from src.operations.auth import get_current_active_user
+from src.schemas.ProfileSummary import ProfileSummary
+from src.services.user_database.tables import User
+from src.settings import get_settings
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_QUERY = "profile"
+
+
+# region profile store
+class ProfileStore:
+    """The most recent request profiles, kept in memory until an admin fetches them."""
+
+    def __init__(self, max_profiles: int) -> None:
+        self.max_profiles = max_profiles
+        self._profiles: OrderedDict[str, tuple[ProfileSummary, object]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, method: str, path: str, session) -> str:
+        summary = ProfileSummary(
+            id=uuid.uuid4().hex,
+            method=method,
+            path=path,
+            duration=session.duration,
+            profiled_at=datetime.now(UTC),
+        )
+        with self._lock:
+            self._profiles[summary.id] = (summary, session)
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+        return summary.id
+
+    def list(self) -> list[ProfileSummary]:
+        with self._lock:
+            return [summary for summary, _ in reversed(self._profiles.values())]
+
+    def render(self, profile_id: str, format: ProfileFormats) -> str | None:
+        from pyinstrument.renderers import HTMLRenderer, SpeedscopeRenderer
+
+        with self._lock:
+            entry = self._profiles.get(profile_id)
+        if entry is None:
+            return None
+        renderer = SpeedscopeRenderer() if format == ProfileFormats.Speedscope else HTMLRenderer()
+        return renderer.render(entry[1])
+
+
+@lru_cache
+def get_profile_store() -> ProfileStore:
+    return ProfileStore(max_profiles=get_settings().profiling_max_profiles)
+
+
+# endregion
+
+
+# region single request profiling
+def profiling_requested(scope: Scope) -> bool:
+    if any(name == PROFILE_HEADER and value not in (b"", b"0") for name, value in scope["headers"]):
+        return True
+    flag = parse_qs(scope["query_string"].decode("latin-1")).get(PROFILE_QUERY)
+    return flag is not None and flag[-1] not in ("", "0")
+
+
+class ProfilingMiddleware:
+    """Profile admin requests to the data routes carrying an X-Profile header or ?profile=1."""
+
+    def __init__(self, app: ASGIApp, interval: float) -> None:
+        self.app = app
+        self.interval = interval
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not profiling_requested(scope):
+            await self.app(scope, receive, send)
+            return
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            logger.warning("profiling requested but pyinstrument is not installed")
+            await self.app(scope, receive, send)
+            return
+        # the admin check runs inside the route and only starts the profiler once it passed, a request
+        # that isn't allowed to profile never pays for the sampling
+        profiler = Profiler(interval=self.interval, async_mode="enabled")
+        scope.setdefault("state", {})["profiler"] = profiler
+
+        async def send_with_profile(message: Message) -> None:
+            if message["type"] == "http.response.start" and profiler.is_running:
+                session = profiler.stop()
+                profile_id = get_profile_store().add(scope["method"], scope["path"], session)
+                MutableHeaders(scope=message).append("X-Profile-Id", profile_id)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            if profiler.is_running:
+                profiler.stop()
+
+
+async def authorize_profiling(
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+) -> None:
+    profiler = getattr(request.state, "profiler", None)
+    if profiler is None:
+        return
+    if current_user.role not in (Roles.Admin, Roles.SuperAdmin):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Profiling requires admin privileges")
+    profiler.start()
+
+
+# endregion
+
+
+# region continuous sampling
+class StackSampler:
+    """Low rate sampler of every thread's stack, aggregated into folded stacks across requests."""
+
+    def __init__(self, interval: float, max_depth: int = 64, max_stacks: int = 10_000) -> None:
+        self.interval = interval
+        self.max_depth = max_depth
+        self.max_stacks = max_stacks
+        self.samples = 0
+        self._stacks: Counter[str] = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+
+    def top(self, limit: int) -> list[tuple[str, int]]:
+        with self._lock:
+            return self._stacks.most_common(limit)
+
+    def _run(self) -> None:
+        # one sample walks a few stacks, at the default 10 Hz the overhead is negligible
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        stacks = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                stack.append(f"{frame.f_code.co_filename.rsplit('/', 1)[-1]}:{frame.f_code.co_name}")
+                frame = frame.f_back
+            stacks.append(";".join(reversed(stack)))
+        with self._lock:
+            self.samples += 1
+            for stack in stacks:
+                if stack not in self._stacks and len(self._stacks) >= self.max_stacks:
+                    stack = "[other]"
+                self._stacks[stack] += 1
+
+
+@lru_cache
+def get_stack_sampler() -> StackSampler:
+    return StackSampler(interval=get_settings().profiling_sample_interval_seconds or 0.1)
+
+
+# endregion
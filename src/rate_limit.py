@@ -0,0 +1,139 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Annotated, Protocol
+
+from fastapi import Depends, HTTPException, Request, status
+
+from src.operations.auth import get_current_active_user
+from src.services.user_database.tables import User
+from src.settings import Settings, get_settings
+
+
+# region backends
+class RateLimitBackend(Protocol):
+    def acquire(self, key: str, capacity: int, refill_per_second: float) -> float:
+        """Take one token from the bucket, returns 0 when allowed or the seconds until a token is available."""
+        ...
+
+
+class InMemoryRateLimitBackend:
+    def __init__(self, max_keys: int = 100_000) -> None:
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, capacity: int, refill_per_second: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * refill_per_second)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                retry_after = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                retry_after = (1 - tokens) / refill_per_second
+            self._buckets.move_to_end(key)
+            # least recently used first, the bucket idle the longest has refilled the most
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+
+class RedisRateLimitBackend:
+    # shared across workers and instances, the bucket is updated atomically by a lua script
+    SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local refill = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated_at = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + (now - updated_at) * refill)
+    local retry_after = 0
+    if tokens >= 1 then
+        tokens = tokens - 1
+    else
+        retry_after = (1 - tokens) / refill
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated_at', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill))
+    return tostring(retry_after)
+    """
+
+    def __init__(self, url: str) -> None:
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("the redis rate limit backend requires the redis package") from e
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def acquire(self, key: str, capacity: int, refill_per_second: float) -> float:
+        return float(self._script(keys=[f"rate_limit:{key}"], args=[capacity, refill_per_second, time.time()]))
+
+
+@lru_cache
+def get_rate_limit_backend(backend: str, redis_url: str | None) -> RateLimitBackend:
+    match backend:
+        case "memory":
+            return InMemoryRateLimitBackend()
+        case "redis":
+            return RedisRateLimitBackend(url=redis_url)
+        case _:
+            raise ValueError(f"Invalid rate limit backend: {backend}")
+
+
+# endregion
+
+
+# region dependencies
+def _check(settings: Settings, key: str, capacity: int, refill_per_second: float) -> None:
+    backend = get_rate_limit_backend(settings.rate_limit_backend, settings.rate_limit_redis_url)
+    retry_after = backend.acquire(key, capacity, refill_per_second)
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+async def limit_user_requests(
+    settings: Annotated[Settings, Depends(get_settings)],
+    current_user: User = Depends(get_current_active_user),
+) -> None:
+    _check(
+        settings=settings,
+        key=f"user:{current_user.id}",
+        capacity=settings.rate_limit_user_capacity,
+        refill_per_second=settings.rate_limit_user_refill_per_second,
+    )
+
+
+def client_address(request: Request, trusted_proxy_hops: int) -> str:
+    # each trusted proxy appends the address it saw, entries further left are set by the client
+    if trusted_proxy_hops > 0:
+        forwarded = [i.strip() for i in ",".join(request.headers.getlist("x-forwarded-for")).split(",") if i.strip()]
+        if len(forwarded) >= trusted_proxy_hops:
+            return forwarded[-trusted_proxy_hops]
+    return request.client.host if request.client else "unknown"
+
+
+async def limit_login_requests(
+    request: Request,
+    settings: Annotated[Settings, Depends(get_settings)],
+) -> None:
+    client = client_address(request, settings.rate_limit_trusted_proxy_hops)
+    _check(
+        settings=settings,
+        key=f"login:{client}",
+        capacity=settings.rate_limit_login_capacity,
+        refill_per_second=settings.rate_limit_login_refill_per_second,
+    )
+
+
+# endregion
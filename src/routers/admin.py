@@ -0,0 +1,73 @@
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+
+from src.enums.ProfileFormats import ProfileFormats
+from src.operations.auth import get_current_admin_user
+from src.profiling import get_profile_store, get_stack_sampler
+from src.schemas.HotStacksResponse import HotStack, HotStacksResponse
+from src.schemas.ProfileSummary import ProfileSummary
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(get_current_admin_user)])
+
+
+# region profiles
+@router.get(
+    "/profiles",
+    response_model=List[ProfileSummary],
+    status_code=status.HTTP_200_OK,
+    summary="List stored request profiles",
+)
+async def list_profiles():
+    return get_profile_store().list()
+
+
+@router.get(
+    "/profiles/{profile_id}",
+    status_code=status.HTTP_200_OK,
+    summary="Get a stored request profile",
+)
+async def get_profile(
+    profile_id: str,
+    format: ProfileFormats = ProfileFormats.Speedscope,
+):
+    try:
+        content = get_profile_store().render(profile_id, format)
+    except ImportError:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail="pyinstrument is not installed")
+    if content is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+    media_type = "application/json" if format == ProfileFormats.Speedscope else "text/html"
+    return Response(content=content, media_type=media_type)
+
+
+# endregion
+
+
+# region continuous sampling
+@router.get(
+    "/hot_stacks",
+    response_model=HotStacksResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Get the hottest stacks seen by the continuous sampler",
+)
+async def get_hot_stacks(limit: int = 50):
+    sampler = get_stack_sampler()
+    return HotStacksResponse(
+        running=sampler.running,
+        interval=sampler.interval if sampler.running else None,
+        samples=sampler.samples,
+        stacks=[HotStack(stack=stack, samples=samples) for stack, samples in sampler.top(limit)],
+    )
+
+
+@router.delete(
+    "/hot_stacks",
+    status_code=status.HTTP_204_NO_CONTENT,
+    summary="Reset the continuous sampler",
+)
+async def reset_hot_stacks():
+    get_stack_sampler().reset()
+
+
+# endregion
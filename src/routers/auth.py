@@ -6,6 +6,7 @@ from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.operations.auth import authenticate_user, create_access_token
+from src.rate_limit import limit_login_requests
 from src.schemas.Token import Token
 from src.settings import Settings, get_settings
 
@@ -14,7 +15,7 @@ from ..dependencies import get_user_db_session
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 
-@router.post("/token", response_model=Token)
+@router.post("/token", response_model=Token, dependencies=[Depends(limit_login_requests)])
 async def login(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
     settings: Annotated[Settings, Depends(get_settings)],
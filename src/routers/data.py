@@ -1,28 +1,57 @@
 import uuid
+from datetime import date
 from typing import Annotated, List, Union
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi_pagination import Page, Params, paginate
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi_pagination import Page, Params
 from fastapi_pagination.utils import disable_installed_extensions_check
 from sqlmodel import Session
 
-from src.dependencies import get_data_db_session, get_user_db_session
+from src.compression import cached_response
+from src.conditional import not_modified
+from src.dependencies import get_shard_sessions, get_tracking_batchers, get_user_db_session
+from src.enums.CountStrategies import CountStrategies
+from src.enums.DistinctStrategies import DistinctStrategies
+from src.enums.HistogramIntervals import HistogramIntervals
+from src.enums.ImportFormats import ImportFormats
+from src.enums.ScoreGroups import ScoreGroups
 from src.enums.Tables import Tables
+from src.operations.analytics import get_activity_analytics
 from src.operations.auth import get_current_active_user
 from src.operations.data import (
+    READ_MODELS,
     add_data,
     add_tracking,
     delete_data,
     get_data,
     get_total_scores,
+    get_total_scores_batch,
     get_total_user_score,
     get_user_activities,
     get_user_daily_scores,
     update_data,
 )
+from src.operations.changes import get_tracking_changes
+from src.operations.imports import import_catalog
+from src.operations.redemptions import get_balance, redeem_reward
+from src.operations.scores import MAX_RANK_NEIGHBORS, get_group_leaderboard, get_user_rank
+from src.operations.tracking import TrackingBatcher
+from src.operations.versions import get_user_data_stamp
+from src.profiling import authorize_profiling
+from src.rate_limit import limit_user_requests
+from src.schemas.ActivityAnalyticsResponse import ActivityAnalyticsResponse
 from src.schemas.AggregatedScores import AggregatedScores
+from src.schemas.BalanceResponse import BalanceResponse
+from src.schemas.CatalogImportResponse import CatalogImportResponse
 from src.schemas.DeleteResponse import DeleteResponse
+from src.schemas.GroupLeaderboardResponse import GroupLeaderboardResponse
+from src.schemas.RedemptionResponse import RedemptionResponse
+from src.schemas.TotalScoreBatchRequest import TotalScoreBatchRequest
+from src.schemas.TrackingChangesResponse import TrackingChangesResponse
 from src.schemas.TotalScoreResponse import TotalScoreResponse, TotalUserScoreResponse
+from src.schemas.UserRankResponse import UserRankResponse
+from src.services.data_database.shards import ShardSessions
+from src.services.fieldsets import parse_fields
 from src.services.data_database.tables import (
     ActivityCreate,
     ActivityRead,
@@ -35,10 +64,15 @@ from src.services.data_database.tables import (
     TrackingWithActivityRead,
 )
 from src.services.user_database.tables import User
+from src.settings import Settings, get_settings
 
 disable_installed_extensions_check()
 
-router = APIRouter(prefix="/data", tags=["data"])
+router = APIRouter(
+    prefix="/data",
+    tags=["data"],
+    dependencies=[Depends(limit_user_requests), Depends(authorize_profiling)],
+)
 
 
 # region get routes
@@ -56,15 +90,48 @@ router = APIRouter(prefix="/data", tags=["data"])
 )
 async def get_table_data(
     table: Tables,
-    session: Session = Depends(get_data_db_session),
+    request: Request,
+    settings: Annotated[Settings, Depends(get_settings)],
+    count: CountStrategies | None = None,
+    fields: str | None = None,
+    shards: ShardSessions = Depends(get_shard_sessions),
+    params: Params = Depends(),
     current_user: User = Depends(get_current_active_user),
 ):
     try:
-        response = await get_data(
-            session=session,
+        selected = parse_fields(fields, READ_MODELS[table])
+        # the catalogs are the same for every user, tracking changes too often to be worth caching
+        if table != Tables.Tracking and (cached := cached_response(request, settings, tag=table)) is not None:
+            return cached
+        page = await get_data(
+            session=shards.primary,
+            shards=shards,
             table=table,
+            params=params,
+            count=count or settings.count_strategies.get(table, CountStrategies.Exact),
+            fields=selected,
         )
-        return paginate(response)
+        if selected is not None:
+            # serialized with the slim model, the route's response model requires every field
+            return Response(content=page.model_dump_json(), media_type="application/json")
+        return page
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get(
+    "/balance/{user_id}",
+    response_model=BalanceResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Get the points a user has available to redeem",
+)
+async def get_user_balance(
+    user_id: uuid.UUID,
+    shards: ShardSessions = Depends(get_shard_sessions),
+    current_user: User = Depends(get_current_active_user),
+):
+    try:
+        return await get_balance(session=shards.for_user(user_id), user_id=user_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -77,15 +144,53 @@ async def get_table_data(
 )
 async def get_user_score(
     user_id: uuid.UUID,
+    request: Request,
+    response: Response,
+    start: date | None = None,
+    end: date | None = None,
     user_session: Session = Depends(get_user_db_session),
-    data_session: Session = Depends(get_data_db_session),
+    shards: ShardSessions = Depends(get_shard_sessions),
     current_user: User = Depends(get_current_active_user),
 ):
     try:
+        etag, last_modified = get_user_data_stamp(
+            session=shards.for_user(user_id),
+            user_session=user_session,
+            user_id=user_id,
+        )
+        if (cached := not_modified(request, response, etag, last_modified)) is not None:
+            return cached
         return await get_total_user_score(
-            data_session=data_session,
+            data_session=shards.for_user(user_id),
             user_session=user_session,
             user_id=user_id,
+            start=start,
+            end=end,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get(
+    "/total_score/{user_id}/rank",
+    response_model=UserRankResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Get rank of user",
+)
+async def get_user_score_rank(
+    user_id: uuid.UUID,
+    neighbors: Annotated[int, Query(ge=0, le=MAX_RANK_NEIGHBORS)] = 2,
+    user_session: Session = Depends(get_user_db_session),
+    shards: ShardSessions = Depends(get_shard_sessions),
+    current_user: User = Depends(get_current_active_user),
+):
+    try:
+        return await get_user_rank(
+            data_session=shards.for_user(user_id),
+            shards=shards,
+            user_session=user_session,
+            user_id=user_id,
+            neighbors=neighbors,
         )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -98,19 +203,51 @@ async def get_user_score(
     summary="Get total score of all users",
 )
 async def get_total_score(
-    data_session: Session = Depends(get_data_db_session),
+    shards: ShardSessions = Depends(get_shard_sessions),
     user_session: Session = Depends(get_user_db_session),
     current_user: User = Depends(get_current_active_user),
 ):
     try:
         return await get_total_scores(
-            data_session=data_session,
+            data_session=shards.primary,
+            shards=shards,
             user_session=user_session,
         )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.get(
+    "/leaderboard/{group}",
+    response_model=GroupLeaderboardResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Get team or country leaderboard",
+)
+async def get_leaderboard(
+    group: ScoreGroups,
+    request: Request,
+    settings: Annotated[Settings, Depends(get_settings)],
+    per_capita: bool = False,
+    limit: int = 10,
+    shards: ShardSessions = Depends(get_shard_sessions),
+    user_session: Session = Depends(get_user_db_session),
+    current_user: User = Depends(get_current_active_user),
+):
+    try:
+        if (cached := cached_response(request, settings, tag="leaderboard")) is not None:
+            return cached
+        return await get_group_leaderboard(
+            data_session=shards.primary,
+            shards=shards,
+            user_session=user_session,
+            group=group,
+            per_capita=per_capita,
+            limit=limit,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get(
     "/tracking/{user_id}/get",
     response_model=Page[ActivityRead],
@@ -119,16 +256,18 @@ async def get_total_score(
 )
 async def get_user_tracking(
     user_id: uuid.UUID,
-    session: Session = Depends(get_data_db_session),
+    count: CountStrategies = CountStrategies.Exact,
+    shards: ShardSessions = Depends(get_shard_sessions),
     params: Params = Depends(),
     current_user: User = Depends(get_current_active_user),
 ):
     try:
-        response = await get_user_activities(
-            session=session,
+        return await get_user_activities(
+            session=shards.for_user(user_id),
             user_id=user_id,
+            params=params,
+            count=count,
         )
-        return paginate(response)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -141,15 +280,91 @@ async def get_user_tracking(
 )
 async def get_daily_scores(
     user_id: uuid.UUID,
-    data_session: Session = Depends(get_data_db_session),
+    request: Request,
+    response: Response,
+    start: date | None = None,
+    end: date | None = None,
+    shards: ShardSessions = Depends(get_shard_sessions),
     user_session: Session = Depends(get_user_db_session),
     current_user: User = Depends(get_current_active_user),
 ):
     try:
+        etag, last_modified = get_user_data_stamp(
+            session=shards.for_user(user_id),
+            user_session=user_session,
+            user_id=user_id,
+        )
+        if (cached := not_modified(request, response, etag, last_modified)) is not None:
+            return cached
         return await get_user_daily_scores(
-            data_session=data_session,
+            data_session=shards.for_user(user_id),
             user_session=user_session,
             user_id=user_id,
+            start=start,
+            end=end,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get(
+    "/analytics/activities",
+    response_model=ActivityAnalyticsResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Get popularity of activities over time",
+)
+async def get_analytics(
+    settings: Annotated[Settings, Depends(get_settings)],
+    start: date | None = None,
+    end: date | None = None,
+    interval: HistogramIntervals = HistogramIntervals.Day,
+    distinct: DistinctStrategies = DistinctStrategies.Exact,
+    shards: ShardSessions = Depends(get_shard_sessions),
+    current_user: User = Depends(get_current_active_user),
+):
+    try:
+        return await get_activity_analytics(
+            session=shards.primary,
+            start=start,
+            end=end,
+            interval=interval,
+            distinct=distinct,
+            max_buckets=settings.analytics_max_buckets,
+            hll_precision=settings.analytics_hll_precision,
+            shards=shards,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get(
+    "/changes",
+    response_model=TrackingChangesResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Get tracking changes after a cursor",
+    description=(
+        "Changes are released once every older transaction of the database has finished, so a long or idle "
+        "in transaction session, a score reconciliation or a large chunked delete holds the feed back until it "
+        "ends. Tracking removed by deleting its activity is reported, rows removed by a catalog sync repairing "
+        "a shard that missed an activity delete are not."
+    ),
+)
+async def get_changes(
+    settings: Annotated[Settings, Depends(get_settings)],
+    since: str | None = None,
+    limit: int = 500,
+    wait: float = 0,
+    shards: ShardSessions = Depends(get_shard_sessions),
+    current_user: User = Depends(get_current_active_user),
+):
+    try:
+        return await get_tracking_changes(
+            session=shards.primary,
+            shards=shards,
+            since=since,
+            limit=limit,
+            wait=min(wait, settings.change_feed_max_wait_seconds),
+            poll_interval=settings.change_feed_poll_interval_seconds,
         )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -167,12 +382,13 @@ async def get_daily_scores(
 )
 async def create_reward(
     reward: RewardCreate,
-    session: Session = Depends(get_data_db_session),
+    shards: ShardSessions = Depends(get_shard_sessions),
     current_user: User = Depends(get_current_active_user),
 ):
     try:
         return await add_data(
-            session=session,
+            session=shards.primary,
+            shards=shards,
             data=reward,
         )
         return {}
@@ -188,18 +404,58 @@ async def create_reward(
 )
 async def create_activity(
     reward: ActivityCreate,
-    session: Session = Depends(get_data_db_session),
+    shards: ShardSessions = Depends(get_shard_sessions),
     current_user: User = Depends(get_current_active_user),
 ):
     try:
         return await add_data(
-            session=session,
+            session=shards.primary,
+            shards=shards,
             data=reward,
         )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post(
+    "/{table}/import",
+    response_model=CatalogImportResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Import rewards or activities in bulk, upserted on name",
+    # the body is streamed and parsed row by row instead of being validated as a whole
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "text/csv": {"schema": {"type": "string"}},
+                "application/x-ndjson": {"schema": {"type": "string"}},
+            },
+        }
+    },
+)
+async def import_table_data(
+    table: Tables,
+    request: Request,
+    settings: Annotated[Settings, Depends(get_settings)],
+    format: ImportFormats | None = None,
+    shards: ShardSessions = Depends(get_shard_sessions),
+    current_user: User = Depends(get_current_active_user),
+):
+    try:
+        if format is None:
+            is_csv = request.headers.get("content-type", "").startswith("text/csv")
+            format = ImportFormats.Csv if is_csv else ImportFormats.Ndjson
+        return await import_catalog(
+            shards=shards,
+            table=table,
+            chunks=request.stream(),
+            format=format,
+            batch_rows=settings.catalog_import_batch_rows,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.post(
     "/tracking/add",
     response_model=TrackingWithActivityRead,
@@ -208,20 +464,75 @@ async def create_activity(
 )
 async def create_activity(
     reward: TrackingCreate,
-    session: Session = Depends(get_data_db_session),
+    shards: ShardSessions = Depends(get_shard_sessions),
+    batchers: list[TrackingBatcher] | None = Depends(get_tracking_batchers),
     current_user: User = Depends(get_current_active_user),
 ):
     try:
         return await add_tracking(
-            session=session,
+            session=shards.for_user(current_user.id),
             data=reward,
-            user_id=current_user.id,
+            user=current_user,
+            batcher=batchers[shards.router.shard_of(current_user.id)] if batchers else None,
         )
         return {}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.post(
+    "/reward/{reward_id}/redeem",
+    response_model=RedemptionResponse,
+    status_code=status.HTTP_201_CREATED,
+    summary="Redeem a reward with the points of the current user",
+)
+async def redeem(
+    reward_id: uuid.UUID,
+    settings: Annotated[Settings, Depends(get_settings)],
+    shards: ShardSessions = Depends(get_shard_sessions),
+    current_user: User = Depends(get_current_active_user),
+):
+    try:
+        return await redeem_reward(
+            session=shards.for_user(current_user.id),
+            user_id=current_user.id,
+            reward_id=reward_id,
+            max_retries=settings.redemption_max_retries,
+        )
+    except HTTPException:
+        # an unknown reward or too few points keep their status
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post(
+    "/total_score/batch",
+    response_model=TotalScoreResponse,
+    status_code=status.HTTP_200_OK,
+    summary="Get total score of multiple users",
+)
+async def get_batch_score(
+    data: TotalScoreBatchRequest,
+    settings: Annotated[Settings, Depends(get_settings)],
+    shards: ShardSessions = Depends(get_shard_sessions),
+    user_session: Session = Depends(get_user_db_session),
+    current_user: User = Depends(get_current_active_user),
+):
+    try:
+        return await get_total_scores_batch(
+            data_session=shards.primary,
+            shards=shards,
+            user_session=user_session,
+            user_ids=data.user_ids,
+            start=data.start,
+            end=data.end,
+            max_users=settings.score_batch_max_users,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 # endregion
 
 
@@ -235,12 +546,13 @@ async def create_activity(
 async def update_reward(
     reward_id: uuid.UUID,
     data: RewardUpdate,
-    session: Session = Depends(get_data_db_session),
+    shards: ShardSessions = Depends(get_shard_sessions),
     current_user: User = Depends(get_current_active_user),
 ):
     try:
         return await update_data(
-            session=session,
+            session=shards.primary,
+            shards=shards,
             table=Tables.Rewards,
             data=data,
             id=reward_id,
@@ -258,12 +570,13 @@ async def update_reward(
 async def update_reward(
     activity_id: uuid.UUID,
     data: ActivityUpdate,
-    session: Session = Depends(get_data_db_session),
+    shards: ShardSessions = Depends(get_shard_sessions),
     current_user: User = Depends(get_current_active_user),
 ):
     try:
         return await update_data(
-            session=session,
+            session=shards.primary,
+            shards=shards,
             table=Tables.Activity,
             data=data,
             id=activity_id,
@@ -285,12 +598,13 @@ async def update_reward(
 )
 async def delete_reward(
     reward_id: uuid.UUID,
-    session: Session = Depends(get_data_db_session),
+    shards: ShardSessions = Depends(get_shard_sessions),
     current_user: User = Depends(get_current_active_user),
 ):
     try:
         return await delete_data(
-            session=session,
+            session=shards.primary,
+            shards=shards,
             table=Tables.Rewards,
             id=reward_id,
         )
@@ -306,14 +620,17 @@ async def delete_reward(
 )
 async def delete_activity(
     activity_id: uuid.UUID,
-    session: Session = Depends(get_data_db_session),
+    settings: Annotated[Settings, Depends(get_settings)],
+    shards: ShardSessions = Depends(get_shard_sessions),
     current_user: User = Depends(get_current_active_user),
 ):
     try:
         return await delete_data(
-            session=session,
+            session=shards.primary,
+            shards=shards,
             table=Tables.Activity,
             id=activity_id,
+            chunk_size=settings.tracking_delete_chunk_size,
         )
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -327,12 +644,13 @@ async def delete_activity(
 )
 async def delete_tracking(
     tracking_id: uuid.UUID,
-    session: Session = Depends(get_data_db_session),
+    shards: ShardSessions = Depends(get_shard_sessions),
     current_user: User = Depends(get_current_active_user),
 ):
     try:
         return await delete_data(
-            session=session,
+            session=shards.primary,
+            shards=shards,
             table=Tables.Tracking,
             id=tracking_id,
         )
@@ -1,6 +1,6 @@
 from typing import List
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from fastapi_pagination import Page, Params, paginate
 from fastapi_pagination.utils import disable_installed_extensions_check
 from sqlalchemy import exc
@@ -8,7 +8,9 @@ from sqlmodel import Session
 
 from src.dependencies import get_user_db_session
 from src.operations.auth import get_current_active_user
-from src.operations.user import create_new_user, get_users
+from src.operations.user import create_new_user, get_users, get_users_page
+from src.rate_limit import limit_user_requests
+from src.services.fieldsets import parse_fields
 from src.services.user_database.tables import User, UserCreate, UserRead
 
 disable_installed_extensions_check()
@@ -41,17 +43,24 @@ async def create_user(
     "/all/",
     response_model=Page[UserRead],
     summary="Get a user all users",
+    dependencies=[Depends(limit_user_requests)],
 )
 async def get_user(
     session: Session = Depends(get_user_db_session),
     current_user: User = Depends(get_current_active_user),
     params: Params = Depends(),
+    fields: str | None = None,
 ):
     try:
-        response = await get_users(
-            session=session,
-        )
+        selected = parse_fields(fields, UserRead)
+        if selected is not None:
+            page = await get_users_page(session=session, fields=selected, params=params)
+            # serialized with the slim model, the route's response model requires every field
+            return Response(content=page.model_dump_json(), media_type="application/json")
+        response = await get_users(session=session)
         return paginate(response)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except exc.IntegrityError:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
@@ -0,0 +1,38 @@
+import uuid
+from datetime import date
+from typing import List
+
+from pydantic import BaseModel
+
+from src.enums.DistinctStrategies import DistinctStrategies
+from src.enums.HistogramIntervals import HistogramIntervals
+
+
+class HistogramBucket(BaseModel):
+    start: date
+    events: int
+
+
+class PointsPercentiles(BaseModel):
+    # points earned on the activity per participating user
+    p50: int
+    p90: int
+    p99: int
+    max: int
+
+
+class ActivityAnalytics(BaseModel):
+    activity_id: uuid.UUID
+    name: str
+    events: int
+    distinct_users: int
+    points: PointsPercentiles
+    histogram: List[HistogramBucket]
+
+
+class ActivityAnalyticsResponse(BaseModel):
+    start: date
+    end: date
+    interval: HistogramIntervals
+    distinct: DistinctStrategies
+    activities: List[ActivityAnalytics]
@@ -0,0 +1,10 @@
+import uuid
+
+from pydantic import BaseModel
+
+
+class BalanceResponse(BaseModel):
+    user_id: uuid.UUID
+    score: int
+    spent: int
+    available: int
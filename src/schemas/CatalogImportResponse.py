@@ -0,0 +1,17 @@
+from typing import List
+
+from pydantic import BaseModel
+
+
+class RejectedRow(BaseModel):
+    line: int
+    detail: str
+
+
+class CatalogImportResponse(BaseModel):
+    inserted: int
+    updated: int
+    unchanged: int
+    rejected: int
+    # the first rejected rows only, rejected counts all of them
+    errors: List[RejectedRow]
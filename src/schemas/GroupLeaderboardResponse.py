@@ -0,0 +1,18 @@
+from typing import List
+
+from pydantic import BaseModel
+
+from src.enums.ScoreGroups import ScoreGroups
+
+
+class GroupScoreResponse(BaseModel):
+    name: str
+    total_score: int
+    members: int
+    per_capita_score: float
+
+
+class GroupLeaderboardResponse(BaseModel):
+    group: ScoreGroups
+    per_capita: bool
+    groups: List[GroupScoreResponse]
@@ -0,0 +1,15 @@
+from typing import List
+
+from pydantic import BaseModel
+
+
+class HotStack(BaseModel):
+    stack: str
+    samples: int
+
+
+class HotStacksResponse(BaseModel):
+    running: bool
+    interval: float | None
+    samples: int
+    stacks: List[HotStack]
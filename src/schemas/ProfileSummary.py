@@ -0,0 +1,11 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+
+class ProfileSummary(BaseModel):
+    id: str
+    method: str
+    path: str
+    duration: float
+    profiled_at: datetime
@@ -0,0 +1,9 @@
+from pydantic import BaseModel
+
+from src.schemas.BalanceResponse import BalanceResponse
+from src.services.data_database.tables import RedemptionRead
+
+
+class RedemptionResponse(BaseModel):
+    redemption: RedemptionRead
+    balance: BalanceResponse
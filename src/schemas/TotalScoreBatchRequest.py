@@ -0,0 +1,11 @@
+import uuid
+from datetime import date
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+
+class TotalScoreBatchRequest(BaseModel):
+    user_ids: List[uuid.UUID]
+    start: Optional[date] = None
+    end: Optional[date] = None
@@ -0,0 +1,22 @@
+import uuid
+from datetime import datetime
+from typing import List
+
+from pydantic import BaseModel
+
+from src.enums.ChangeOperations import ChangeOperations
+
+
+class TrackingChangeRead(BaseModel):
+    cursor: str
+    operation: ChangeOperations
+    tracking_id: uuid.UUID
+    user_id: uuid.UUID
+    activity_id: uuid.UUID
+    added_at: datetime
+    changed_at: datetime
+
+
+class TrackingChangesResponse(BaseModel):
+    changes: List[TrackingChangeRead]
+    cursor: str
@@ -0,0 +1,21 @@
+from typing import List
+
+from pydantic import BaseModel
+
+from src.services.user_database.tables import UserRead
+
+
+class RankedUserScore(BaseModel):
+    user: UserRead
+    total_score: int
+    rank: int
+
+
+class UserRankResponse(BaseModel):
+    user: UserRead
+    total_score: int
+    rank: int
+    percentile: float
+    total_users: int
+    above: List[RankedUserScore]
+    below: List[RankedUserScore]
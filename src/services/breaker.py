@@ -0,0 +1,114 @@
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import Engine, event
+
+from src.enums.CircuitStates import CircuitStates
+from src.logging import logger
+from src.services.deadline import QUERY_CANCELED, current_deadline
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """Fail fast on a database after consecutive timeouts, let a single probe through once reset_timeout passed."""
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CircuitStates.Closed
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_started_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def before(self) -> None:
+        if self.state == CircuitStates.Closed:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self.state == CircuitStates.Open and now - self.opened_at >= self.reset_timeout:
+                self.state = CircuitStates.HalfOpen
+                self._probe_started_at = now
+                return
+            if self.state == CircuitStates.HalfOpen and now - self._probe_started_at >= self.reset_timeout:
+                # the previous probe never reported back, send another one
+                self._probe_started_at = now
+                return
+            if self.state == CircuitStates.Closed:
+                return
+        _record_outage(self)
+        raise CircuitOpen(f"{self.name} database unavailable, retry in {self.retry_after:.0f}s")
+
+    def record_success(self) -> None:
+        if self.state == CircuitStates.Closed and not self.failures:
+            return
+        with self._lock:
+            if self.state != CircuitStates.Closed:
+                logger.info(f"{self.name} circuit closed, database recovered")
+            self.state = CircuitStates.Closed
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        _record_outage(self)
+        with self._lock:
+            self.failures += 1
+            if self.state == CircuitStates.HalfOpen or (
+                self.state == CircuitStates.Closed and self.failures >= self.failure_threshold
+            ):
+                logger.warning(f"{self.name} circuit opened after {self.failures} consecutive failures")
+                self.state = CircuitStates.Open
+                self.opened_at = time.monotonic()
+
+
+# the breakers that failed or rejected a query during the current request, set by the middleware
+current_outages: ContextVar[list[CircuitBreaker] | None] = ContextVar("current_outages", default=None)
+
+
+def _record_outage(breaker: CircuitBreaker) -> None:
+    outages = current_outages.get()
+    if outages is not None and breaker not in outages:
+        outages.append(breaker)
+
+
+def _caused_by_socket_error(error: BaseException | None) -> bool:
+    # pg8000 raises a refused or timed out connect as an InterfaceError, the socket error is its cause
+    while error is not None:
+        if isinstance(error, (OSError, TimeoutError)):
+            return True
+        error = error.__cause__
+    return False
+
+
+def _is_timeout(context) -> bool:
+    if context.is_disconnect or _caused_by_socket_error(context.original_exception):
+        return True
+    error = context.original_exception
+    if error.args and isinstance(error.args[0], dict) and error.args[0].get("C") == QUERY_CANCELED:
+        # a cancel because the client went away says nothing about the database
+        deadline = current_deadline.get()
+        return deadline is None or not deadline.cancelled
+    return False
+
+
+def enable_circuit_breaker(engine: Engine, name: str, failure_threshold: int, reset_timeout: float) -> None:
+    breaker = CircuitBreaker(name, failure_threshold, reset_timeout)
+    # TimedQueuePool checks it before waiting for a connection, an open circuit never queues on the pool
+    engine.pool.breaker = breaker
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        breaker.record_success()
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        if _is_timeout(context):
+            breaker.record_failure()
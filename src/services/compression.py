@@ -0,0 +1,132 @@
+import gzip
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from src.logging import logger
+from src.settings import get_settings
+
+IDENTITY = "identity"
+
+
+# region compressor
+class Compressor:
+    """Content negotiation and compression of response bodies, in the server's order of preference."""
+
+    def __init__(self, encodings: list[str], minimum_size: int, gzip_level: int, brotli_quality: int) -> None:
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self._brotli = None
+        if "br" in encodings:
+            try:
+                import brotli
+
+                self._brotli = brotli
+            except ImportError:
+                logger.warning("brotli compression configured but the brotli package is not installed")
+        self.encodings = [i for i in encodings if i == "gzip" or (i == "br" and self._brotli is not None)]
+
+    def negotiate(self, accept_encoding: str | None) -> str | None:
+        # highest q value wins, ties go to the server's preference; None means send the body as is
+        if not accept_encoding or not self.encodings:
+            return None
+        accepted = {}
+        for item in accept_encoding.split(","):
+            name, _, params = item.strip().partition(";")
+            q = 1.0
+            if params.strip().startswith("q="):
+                try:
+                    q = float(params.strip()[2:])
+                except ValueError:
+                    q = 0.0
+            accepted[name.strip().lower()] = q
+        wildcard = accepted.get("*", 0.0)
+        best = max(self.encodings, key=lambda i: accepted.get(i, wildcard))
+        return best if accepted.get(best, wildcard) > 0 else None
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == "br":
+            return self._brotli.compress(body, quality=self.brotli_quality)
+        # mtime=0 keeps the output identical for identical bodies
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+
+@lru_cache
+def get_compressor() -> Compressor:
+    settings = get_settings()
+    return Compressor(
+        encodings=settings.compression_encodings,
+        minimum_size=settings.compression_minimum_size,
+        gzip_level=settings.compression_gzip_level,
+        brotli_quality=settings.compression_brotli_quality,
+    )
+
+
+# endregion
+
+
+# region response cache
+class CachedBody:
+    def __init__(self, tag: str, media_type: str, body: bytes, expires_at: float) -> None:
+        self.tag = tag
+        self.media_type = media_type
+        self.stored_at = time.monotonic()
+        self.expires_at = expires_at
+        self.variants: dict[str, bytes] = {IDENTITY: body}
+
+    def variant(self, encoding: str | None, compressor: Compressor) -> tuple[str | None, bytes]:
+        body = self.variants[IDENTITY]
+        if encoding is None or len(body) < compressor.minimum_size:
+            return None, body
+        if encoding not in self.variants:
+            # compressed once per encoding, later hits send the stored bytes
+            self.variants[encoding] = compressor.compress(body, encoding)
+        return encoding, self.variants[encoding]
+
+
+class ResponseCache:
+    """Serialized bodies of responses shared by all users, stored together with their compressed variants."""
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, CachedBody] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> CachedBody | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at < time.monotonic():
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def get_stale(self, key: str, max_stale: float) -> CachedBody | None:
+        # expired entries stay until they are evicted, they stand in while a database is unavailable
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry.expires_at > max_stale:
+                return None
+            return entry
+
+    def set(self, key: str, entry: CachedBody) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, tag: str) -> None:
+        # only this worker's entries, the ttl bounds how long other workers serve the old body
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry.tag == tag]:
+                del self._entries[key]
+
+
+@lru_cache
+def get_response_cache() -> ResponseCache:
+    return ResponseCache(max_entries=get_settings().response_cache_max_entries)
+
+
+# endregion
@@ -1,29 +1,186 @@
+import asyncio
+import uuid
+from functools import lru_cache
 from typing import Annotated
 
 from fastapi import Depends
+from sqlalchemy import Engine
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import SQLModel, create_engine
 
+from src.logging import logger
+from src.services.breaker import enable_circuit_breaker
+from src.services.deadline import enable_deadlines
+from src.services.pool import TimedQueuePool, limit_connect_time
+from src.services.prepared import enable_prepared_statements
+from src.services.schema_marker import mark_schema_current, schema_is_current
+from src.services.user_database.tables import USERS_SCHEMA
 from src.settings import Settings, get_settings
 
 from . import tables
+from .partitions import ensure_tracking_partitions, prune_tracking_changes
+from .replication import catalog_sync_requested, sync_catalogs
 
 
 async def init_db(settings: Annotated[Settings, Depends(get_settings)]) -> None:
+    for engine in get_shard_router(settings).engines:
+        if settings.skip_current_schema and schema_is_current(engine, name="data", version=tables.SCHEMA_VERSION):
+            logger.info(f"data schema of {engine.url.database} is current, skipping create_all")
+            continue
+        SQLModel.metadata.create_all(engine, checkfirst=True)
+        ensure_table_indexes(engine)
+        mark_schema_current(engine, name="data", version=tables.SCHEMA_VERSION)
+
+
+async def maintain_db(settings: Annotated[Settings, Depends(get_settings)]) -> None:
+    # not needed to serve the first request, runs in the background after startup
+    router = get_shard_router(settings)
+    for engine in router.engines:
+        ensure_tracking_partitions(engine, months_ahead=settings.tracking_partition_months_ahead)
+        if settings.tracking_change_retention_days is not None:
+            prune_tracking_changes(engine, retention_days=settings.tracking_change_retention_days)
+    if len(router) > 1:
+        sync_catalogs(router)
+
+
+async def run_periodic_catalog_sync(settings: Settings) -> None:
+    # repairs shards that missed a write-through replication, early when a replication failed
+    router = get_shard_router(settings)
+    while len(router) > 1:
+        try:
+            await asyncio.wait_for(catalog_sync_requested.wait(), timeout=settings.catalog_sync_interval_seconds)
+        except TimeoutError:
+            pass
+        catalog_sync_requested.clear()
+        try:
+            await asyncio.to_thread(sync_catalogs, router)
+        except Exception as e:
+            logger.error(f"catalog sync failed: {e}")
+
+
+def ensure_table_indexes(engine: Engine) -> None:
+    # create_all skips tables that already exist, their indexes added later are created here; an index on
+    # the partitioned tracking table is created on every partition
+    for model in (tables.Reward, tables.Activity, tables.Tracking):
+        for index in model.__table__.indexes:
+            try:
+                index.create(engine, checkfirst=True)
+            except IntegrityError:
+                # imports into this catalog fail until the duplicates are renamed or removed
+                logger.error(f"{index.name} not created on {engine.url.database}, duplicate names in the table")
+
+
+# region shared engine
+@lru_cache
+def get_shared_engine(
+    url: str,
+    prepared_statements: bool = False,
+    users_schema: str | None = None,
+    transaction_pooling: bool = False,
+) -> Engine:
+    settings = get_settings()
+    # one pool per process, DatabaseEngine is instantiated per request by Depends
     engine = create_engine(
-        f"postgresql+pg8000://{settings.database_user}:{settings.database_password}@{settings.database_domain}/{settings.data_database_name}",
-        # f"mysql+pymysql://{settings.database_user}:{settings.database_password}@{settings.database_domain}/{settings.data_database_name}",
+        url,
+        poolclass=TimedQueuePool,
+        pool_size=20,
+        max_overflow=10,
         echo=False,
+        pool_recycle=3600,
+        # only used in co-located mode, where the user tables share this database
+        execution_options={"schema_translate_map": {USERS_SCHEMA: users_schema}},
+        # a refused or unreachable database fails the connect quickly and counts against the breaker
+        connect_args={"timeout": settings.database_connect_timeout_seconds},
     )
-    SQLModel.metadata.create_all(engine, checkfirst=True)
+    limit_connect_time(engine)
+    enable_deadlines(engine, cancel_backends=not transaction_pooling)
+    enable_circuit_breaker(
+        engine,
+        name=engine.url.database,
+        failure_threshold=settings.circuit_failure_threshold,
+        reset_timeout=settings.circuit_reset_seconds,
+    )
+    # named server-side statements belong to one backend, a transaction-mode pooler hands out any backend
+    if prepared_statements and not transaction_pooling:
+        enable_prepared_statements(engine)
+    return engine
+
+
+def _database_url(settings: Settings, database_name: str) -> str:
+    return f"postgresql+pg8000://{settings.database_user}:{settings.database_password}@{settings.database_domain}/{database_name}"
+    # return f"mysql+pymysql://{settings.database_user}:{settings.database_password}@{settings.database_domain}/{database_name}"
 
 
 class DatabaseEngine:
     def __init__(self, settings: Annotated[Settings, Depends(get_settings)]):
-        self.engine = create_engine(
-            f"postgresql+pg8000://{settings.database_user}:{settings.database_password}@{settings.database_domain}/{settings.data_database_name}",
-            # f"mysql+pymysql://{settings.database_user}:{settings.database_password}@{settings.database_domain}/{settings.data_database_name}",
-            pool_size=20,
-            max_overflow=10,
-            echo=False,
-            pool_recycle=3600,
+        # the primary data database, it holds the catalogs and is also the first tracking shard
+        self.engine = get_shared_engine(
+            _database_url(settings, settings.data_database_name),
+            prepared_statements=settings.prepared_statements,
+            users_schema=settings.users_schema,
+            transaction_pooling=settings.transaction_pooling,
         )
+
+
+# endregion
+
+
+# region shards
+def jump_hash(key: int, buckets: int) -> int:
+    # jump consistent hash (Lamping & Veach), adding a bucket only moves 1/buckets of the keys
+    bucket, candidate = -1, 0
+    while candidate < buckets:
+        bucket = candidate
+        key = (key * 2862933555777941757 + 1) % 2**64
+        candidate = int((bucket + 1) * (2**31 / ((key >> 33) + 1)))
+    return bucket
+
+
+class ShardRouter:
+    """Places tracking, its outbox and the per-user scores on one of the data databases by hash of user_id."""
+
+    def __init__(self, engines: list[Engine]) -> None:
+        self.engines = engines
+
+    def __len__(self) -> int:
+        return len(self.engines)
+
+    @property
+    def primary(self) -> Engine:
+        return self.engines[0]
+
+    def shard_of(self, user_id: uuid.UUID | str) -> int:
+        if len(self.engines) == 1:
+            return 0
+        return jump_hash(uuid.UUID(str(user_id)).int % 2**64, len(self.engines))
+
+
+def get_shard_router(settings: Annotated[Settings, Depends(get_settings)]) -> ShardRouter:
+    urls = tuple(
+        _database_url(settings, name) for name in [settings.data_database_name, *settings.data_shard_database_names]
+    )
+    return _get_shard_router(urls, settings.prepared_statements, settings.users_schema, settings.transaction_pooling)
+
+
+@lru_cache
+def _get_shard_router(
+    urls: tuple[str, ...],
+    prepared_statements: bool,
+    users_schema: str,
+    transaction_pooling: bool,
+) -> ShardRouter:
+    # the keyword arguments match DatabaseEngine, so the primary shard is the very same engine and pool
+    return ShardRouter(
+        engines=[
+            get_shared_engine(
+                url,
+                prepared_statements=prepared_statements,
+                users_schema=users_schema,
+                transaction_pooling=transaction_pooling,
+            )
+            for url in urls
+        ]
+    )
+
+
+# endregion
@@ -0,0 +1,164 @@
+import argparse
+from datetime import UTC, date, datetime
+
+from sqlalchemy import Engine, text
+
+from src.logging import logger
+from src.settings import Settings, get_settings
+
+from .tables import Tracking, TrackingChange, TrackingRollup
+
+TRACKING_TABLE = Tracking.__tablename__
+ROLLUP_TABLE = TrackingRollup.__tablename__
+CHANGE_TABLE = TrackingChange.__tablename__
+
+
+# region helpers
+def _month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _partition_name(month: date) -> str:
+    return f"{TRACKING_TABLE}_{month:%Y_%m}"
+
+
+def _partition_month(name: str) -> date | None:
+    try:
+        return datetime.strptime(name.removeprefix(f"{TRACKING_TABLE}_"), "%Y_%m").date()
+    except ValueError:
+        return None
+
+
+def is_partitioned(engine: Engine) -> bool:
+    with engine.connect() as conn:
+        relkind = conn.execute(
+            text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"),
+            {"table": TRACKING_TABLE},
+        ).scalar_one_or_none()
+    return relkind == "p"
+
+
+def attached_partitions(engine: Engine) -> list[str]:
+    with engine.connect() as conn:
+        return list(
+            conn.execute(
+                text(
+                    "SELECT child.relname FROM pg_inherits "
+                    "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                    "WHERE pg_inherits.inhparent = to_regclass(:table) "
+                    "ORDER BY child.relname"
+                ),
+                {"table": TRACKING_TABLE},
+            ).scalars()
+        )
+
+
+# endregion
+
+
+# region partition management
+def ensure_tracking_partitions(engine: Engine, months_ahead: int) -> list[str]:
+    if not is_partitioned(engine):
+        logger.warning(f"{TRACKING_TABLE} is not partitioned, skipping partition management")
+        return []
+    current = _month_start(datetime.now(UTC).date())
+    created = []
+    with engine.begin() as conn:
+        # rows outside of every monthly range (e.g. backfills) land in the default partition
+        conn.execute(text(f"CREATE TABLE IF NOT EXISTS {TRACKING_TABLE}_default PARTITION OF {TRACKING_TABLE} DEFAULT"))
+        existing = set(attached_partitions(engine))
+        for offset in range(months_ahead + 1):
+            month = _add_months(current, offset)
+            name = _partition_name(month)
+            if name in existing:
+                continue
+            conn.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {TRACKING_TABLE} "
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+                )
+            )
+            created.append(name)
+    if created:
+        logger.info(f"created tracking partitions: {', '.join(created)}")
+    return created
+
+
+def apply_tracking_retention(engine: Engine, retention_months: int, drop: bool = False) -> list[str]:
+    if not is_partitioned(engine):
+        logger.warning(f"{TRACKING_TABLE} is not partitioned, skipping retention")
+        return []
+    cutoff = _add_months(_month_start(datetime.now(UTC).date()), -retention_months)
+    detached = []
+    for name in attached_partitions(engine):
+        month = _partition_month(name)
+        if month is None or month >= cutoff:
+            continue
+        # fold and detach in one transaction so the partition's events are counted exactly once
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    f"INSERT INTO {ROLLUP_TABLE} (user_id, activity_id, day, events) "
+                    f"SELECT user_id, activity_id, CAST(added_at AS DATE), COUNT(*) FROM {name} "
+                    f"GROUP BY user_id, activity_id, CAST(added_at AS DATE) "
+                    f"ON CONFLICT (user_id, activity_id, day) "
+                    f"DO UPDATE SET events = {ROLLUP_TABLE}.events + EXCLUDED.events"
+                )
+            )
+            conn.execute(text(f"ALTER TABLE {TRACKING_TABLE} DETACH PARTITION {name}"))
+            if drop:
+                conn.execute(text(f"DROP TABLE {name}"))
+        detached.append(name)
+    if detached:
+        logger.info(f"{'dropped' if drop else 'detached'} tracking partitions: {', '.join(detached)}")
+    return detached
+
+
+def prune_tracking_changes(engine: Engine, retention_days: int) -> int:
+    # consumers are expected to follow the change feed within the retention window
+    with engine.begin() as conn:
+        pruned = conn.execute(
+            text(f"DELETE FROM {CHANGE_TABLE} WHERE changed_at < timezone('utc', now()) - make_interval(days => :days)"),
+            {"days": retention_days},
+        ).rowcount
+    if pruned:
+        logger.info(f"pruned {pruned} tracking changes")
+    return pruned
+
+
+# endregion
+
+
+# region maintenance command
+def run_maintenance(settings: Settings, retention: bool) -> None:
+    # imported here, the engine module imports this one for startup maintenance
+    from .engine import get_shard_router
+
+    # every shard keeps its own tracking partitions, rollup and outbox
+    for engine in get_shard_router(settings).engines:
+        logger.info(f"maintaining {engine.url.database}")
+        ensure_tracking_partitions(engine, months_ahead=settings.tracking_partition_months_ahead)
+        if settings.tracking_change_retention_days is not None:
+            prune_tracking_changes(engine, retention_days=settings.tracking_change_retention_days)
+        if retention and settings.tracking_retention_months is not None:
+            apply_tracking_retention(
+                engine,
+                retention_months=settings.tracking_retention_months,
+                drop=settings.tracking_retention_drop,
+            )
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create upcoming tracking partitions and apply the retention policy.")
+    parser.add_argument("--retention", action="store_true", help="fold and detach partitions past the retention window")
+    args = parser.parse_args()
+    run_maintenance(settings=get_settings(), retention=args.retention)
+
+
+# endregion
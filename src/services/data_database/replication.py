@@ -0,0 +1,93 @@
+import asyncio
+from typing import TYPE_CHECKING
+
+from sqlalchemy import all_, any_, bindparam, delete
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, select
+
+from src.enums.Tables import Tables
+from src.logging import logger
+from src.utils import batched
+
+from .statements import get_statements
+from .tables import CatalogVersion
+
+if TYPE_CHECKING:
+    from .engine import ShardRouter
+
+# the catalogs are small and written rarely, every shard keeps a full copy for its foreign keys and snapshots
+CATALOG_TABLES = (Tables.Rewards, Tables.Activity)
+# rows per upsert, kept well below the 65535 bind parameters postgres allows in one statement
+CATALOG_BATCH_ROWS = 1000
+# set when a write-through replication failed, wakes the periodic catalog sync early
+catalog_sync_requested = asyncio.Event()
+
+
+def request_catalog_sync() -> None:
+    catalog_sync_requested.set()
+
+
+def _id_array(model, ids) -> bindparam:
+    # one array parameter however many ids there are
+    return bindparam(None, list(ids), type_=ARRAY(model.id.type))
+
+
+def read_catalog(session: Session, table: Tables, ids: set | None = None) -> tuple[list[dict], int | None]:
+    # the whole catalog, or only the rows with the given ids; an id without a row was deleted
+    model = get_statements(table).model
+    statement = select(model)
+    if ids is not None:
+        statement = statement.where(model.id == any_(_id_array(model, ids)))
+    rows = [i.model_dump() for i in session.exec(statement)]
+    version = session.exec(select(CatalogVersion.version).where(CatalogVersion.name == table.value)).one_or_none()
+    return rows, version
+
+
+def write_catalog(
+    session: Session,
+    table: Tables,
+    rows: list[dict],
+    version: int | None,
+    ids: set | None = None,
+) -> None:
+    # make the shard's copy, or the given ids of it, equal to the primary's; rows removed on the primary
+    # are removed here as well
+    model = get_statements(table).model
+    removed = delete(model).where(model.id != all_(_id_array(model, [row["id"] for row in rows])))
+    if ids is not None:
+        removed = removed.where(model.id == any_(_id_array(model, ids)))
+    session.exec(removed)
+    for batch in batched(rows, CATALOG_BATCH_ROWS):
+        statement = pg_insert(model).values(batch)
+        session.exec(
+            statement.on_conflict_do_update(
+                index_elements=[model.id],
+                set_={key: statement.excluded[key] for key in batch[0] if key != "id"},
+            )
+        )
+    if version is not None:
+        statement = pg_insert(CatalogVersion).values(name=table.value, version=version)
+        session.exec(
+            statement.on_conflict_do_update(
+                index_elements=[CatalogVersion.name],
+                set_={"version": statement.excluded.version},
+            )
+        )
+    session.commit()
+
+
+def sync_catalogs(router: "ShardRouter") -> None:
+    # repairs shards that missed a write-through replication, e.g. because they were unreachable
+    with Session(router.primary) as session:
+        catalogs = {table: read_catalog(session, table) for table in CATALOG_TABLES}
+    synced = 0
+    for engine in router.engines[1:]:
+        try:
+            with Session(engine) as session:
+                for table, (rows, version) in catalogs.items():
+                    write_catalog(session, table, rows, version)
+            synced += 1
+        except Exception as e:
+            logger.error(f"syncing catalogs to {engine.url.database} failed: {e}")
+    logger.info(f"synced catalogs to {synced} of {len(router) - 1} shards")
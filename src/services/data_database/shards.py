@@ -0,0 +1,75 @@
+import asyncio
+import uuid
+from typing import Callable, TypeVar
+
+from sqlmodel import Session
+
+from src.enums.Tables import Tables
+from src.logging import logger
+from src.services.pool import TRANSACTION_POOLING
+
+from .engine import ShardRouter
+from .replication import read_catalog, request_catalog_sync, write_catalog
+
+T = TypeVar("T")
+
+
+class ShardSessions:
+    """Sessions on the data shards of one request, opened on first use."""
+
+    def __init__(self, router: ShardRouter, transaction_pooling: bool = False) -> None:
+        self.router = router
+        self.transaction_pooling = transaction_pooling
+        self._sessions: dict[int, Session] = {}
+
+    def __len__(self) -> int:
+        return len(self.router)
+
+    def get(self, index: int) -> Session:
+        if index not in self._sessions:
+            # writes return their rows with RETURNING, keep them loaded after commit instead of re-selecting
+            self._sessions[index] = Session(
+                self.router.engines[index],
+                expire_on_commit=False,
+                info={TRANSACTION_POOLING: self.transaction_pooling},
+            )
+        return self._sessions[index]
+
+    @property
+    def primary(self) -> Session:
+        return self.get(0)
+
+    def for_user(self, user_id: uuid.UUID | str) -> Session:
+        return self.get(self.router.shard_of(user_id))
+
+    def all(self) -> list[Session]:
+        return [self.get(index) for index in range(len(self.router))]
+
+    def replicas(self) -> list[Session]:
+        return self.all()[1:]
+
+    def close(self) -> None:
+        for session in self._sessions.values():
+            session.close()
+
+
+async def fan_out(sessions: list[Session], query: Callable[[Session], T]) -> list[T]:
+    # one worker thread per shard so the shards are queried in parallel, a single shard is queried inline
+    if len(sessions) == 1:
+        return [query(sessions[0])]
+    return await asyncio.gather(*(asyncio.to_thread(query, session) for session in sessions))
+
+
+async def replicate_catalog(shards: ShardSessions, table: Tables, ids: set) -> None:
+    # write-through of the rows changed by a committed catalog write on the primary; the write already
+    # succeeded, so a failing shard is logged and left to the catalog sync, which is woken up to repair it
+    if len(shards) == 1 or not ids:
+        return
+    try:
+        rows, version = read_catalog(shards.primary, table, ids)
+        await fan_out(shards.replicas(), lambda session: write_catalog(session, table, rows, version, ids))
+    except Exception as e:
+        for session in shards.replicas():
+            session.rollback()
+        logger.warning(f"replicating {table} failed, scheduling a catalog sync: {e}")
+        request_catalog_sync()
@@ -0,0 +1,70 @@
+from dataclasses import dataclass
+from functools import lru_cache
+
+from sqlalchemy import Select, bindparam, func
+from sqlalchemy import select as select_rows
+from sqlmodel import SQLModel, select
+from sqlmodel.sql.expression import SelectOfScalar
+
+from src.enums.Tables import Tables
+from src.services.prepared import PREPARE_OPTION
+
+from .tables import Activity, Reward, Tracking
+
+
+@dataclass(frozen=True)
+class TableStatements:
+    model: type[SQLModel]
+    select_all: SelectOfScalar
+    select_by_id: SelectOfScalar
+    select_page: SelectOfScalar
+    count_all: SelectOfScalar
+
+
+def _order(model: type[SQLModel]) -> tuple:
+    # newest tracking first, pages need a total order to be stable
+    if model is Tracking:
+        return Tracking.added_at.desc(), Tracking.id
+    return (model.id,)
+
+
+def _build(model: type[SQLModel]) -> TableStatements:
+    # built once with an :id bind parameter, so every call reuses the same statement object and its
+    # entry in SQLAlchemy's compiled cache, and the driver can keep it as a server-side prepared statement
+    return TableStatements(
+        model=model,
+        select_all=select(model),
+        select_by_id=select(model).where(model.id == bindparam("id")).execution_options(**{PREPARE_OPTION: True}),
+        select_page=select(model)
+        .order_by(*_order(model))
+        .limit(bindparam("limit"))
+        .offset(bindparam("offset"))
+        .execution_options(**{PREPARE_OPTION: True}),
+        count_all=select(func.count()).select_from(model),
+    )
+
+
+STATEMENTS: dict[Tables, TableStatements] = {
+    Tables.Rewards: _build(Reward),
+    Tables.Activity: _build(Activity),
+    Tables.Tracking: _build(Tracking),
+}
+
+
+def get_statements(table: Tables) -> TableStatements:
+    if table not in STATEMENTS:
+        raise ValueError("Invalid table type")
+    return STATEMENTS[table]
+
+
+@lru_cache(maxsize=128)
+def select_page_columns(table: Tables, columns: tuple[str, ...]) -> Select:
+    # select_page narrowed to the given columns, rows instead of models even for a single column
+    model = get_statements(table).model
+    return (
+        select_rows(*(getattr(model, i) for i in columns))
+        .order_by(*_order(model))
+        .limit(bindparam("limit"))
+        .offset(bindparam("offset"))
+        .execution_options(**{PREPARE_OPTION: True})
+    )
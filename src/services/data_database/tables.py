@@ -1,9 +1,18 @@
 import uuid
-from datetime import UTC, datetime, timedelta
+from datetime import date, datetime
 from typing import List, Optional
 
+from sqlalchemy import BigInteger, Index, text
 from sqlmodel import Field, Relationship, SQLModel
 
+# ids and timestamps are generated by postgres so inserts can hand back the row with RETURNING
+SERVER_UUID = {"server_default": text("gen_random_uuid()")}
+SERVER_NOW = {"server_default": text("timezone('utc', now())")}
+SERVER_TXID = {"server_default": text("pg_current_xact_id()::text::bigint")}
+
+# bump whenever tables change so startup runs create_all again instead of trusting the schema marker
+SCHEMA_VERSION = 9
+
 
 # region Rewards
 class RewardBase(SQLModel):
@@ -12,7 +21,10 @@ class RewardBase(SQLModel):
 
 
 class Reward(RewardBase, table=True):
-    id: Optional[uuid.UUID] = Field(default_factory=uuid.uuid4, primary_key=True, nullable=False)
+    # names are the key of bulk imports, see operations/imports.py
+    __table_args__ = (Index("ux_reward_name", "name", unique=True),)
+
+    id: Optional[uuid.UUID] = Field(default=None, primary_key=True, nullable=False, sa_column_kwargs=SERVER_UUID)
 
 
 class RewardCreate(RewardBase):
@@ -38,8 +50,10 @@ class ActivityBase(SQLModel):
 
 
 class Activity(ActivityBase, table=True):
-    id: Optional[uuid.UUID] = Field(default_factory=uuid.uuid4, primary_key=True, nullable=False)
-    tracking: List["Tracking"] = Relationship(back_populates="activity", cascade_delete=True)
+    __table_args__ = (Index("ux_activity_name", "name", unique=True),)
+
+    id: Optional[uuid.UUID] = Field(default=None, primary_key=True, nullable=False, sa_column_kwargs=SERVER_UUID)
+    tracking: List["Tracking"] = Relationship(back_populates="activity", cascade_delete=True, passive_deletes=True)
 
 
 class ActivityCreate(ActivityBase):
@@ -58,13 +72,23 @@ class ActivityUpdate(SQLModel):
 # endregion
 
 
+# region Tracking
 class TrackingBase(SQLModel):
     activity_id: uuid.UUID = Field(nullable=False, foreign_key="activity.id", ondelete="CASCADE")
 
 
 class Tracking(TrackingBase, table=True):
-    id: Optional[uuid.UUID] = Field(default_factory=uuid.uuid4, primary_key=True, nullable=False)
-    added_at: datetime = Field(default=datetime.now(UTC) - timedelta(days=1), nullable=False)
+    # range partitioned by month on added_at, see partitions.py; postgres requires the partition key in the primary key
+    __table_args__ = (
+        # the chunked activity delete and the ON DELETE CASCADE look rows up by activity
+        Index("ix_tracking_activity_id", "activity_id"),
+        # per-user scores, aggregates and date-bounded reads; the primary key leads with id
+        Index("ix_tracking_user_added", "user_id", "added_at"),
+        {"postgresql_partition_by": "RANGE (added_at)"},
+    )
+
+    id: Optional[uuid.UUID] = Field(default=None, primary_key=True, nullable=False, sa_column_kwargs=SERVER_UUID)
+    added_at: Optional[datetime] = Field(default=None, primary_key=True, nullable=False, sa_column_kwargs=SERVER_NOW)
     user_id: Optional[uuid.UUID] = Field(primary_key=True, nullable=False)
     activity: Activity = Relationship(back_populates="tracking")
 
@@ -88,3 +112,112 @@ class TrackingWithActivityRead(TrackingRead):
 
 
 # endregion
+
+
+# region Tracking changes
+class TrackingChange(SQLModel, table=True):
+    # transactional outbox, written in the same transaction as the tracking row it describes
+    __table_args__ = (Index("ix_trackingchange_txid_seq", "txid", "seq"),)
+
+    seq: Optional[int] = Field(default=None, primary_key=True, nullable=False, sa_type=BigInteger)
+    txid: Optional[int] = Field(default=None, nullable=False, sa_type=BigInteger, sa_column_kwargs=SERVER_TXID)
+    operation: str = Field(nullable=False)
+    tracking_id: uuid.UUID = Field(nullable=False)
+    user_id: uuid.UUID = Field(nullable=False)
+    activity_id: uuid.UUID = Field(nullable=False)
+    added_at: datetime = Field(nullable=False)
+    changed_at: Optional[datetime] = Field(default=None, nullable=False, index=True, sa_column_kwargs=SERVER_NOW)
+
+
+# endregion
+
+
+# region Tracking rollup
+class TrackingRollup(SQLModel, table=True):
+    # daily event counts of tracking partitions that were detached by the retention policy
+    user_id: uuid.UUID = Field(primary_key=True, nullable=False)
+    activity_id: uuid.UUID = Field(primary_key=True, nullable=False, foreign_key="activity.id", ondelete="CASCADE")
+    day: date = Field(primary_key=True, nullable=False)
+    events: int = Field(nullable=False)
+
+
+# endregion
+
+
+# region Scores
+class UserScore(SQLModel, table=True):
+    # incrementally maintained total per user, kept in step with tracking writes and reconciled periodically
+    user_id: uuid.UUID = Field(primary_key=True, nullable=False)
+    score: int = Field(default=0, nullable=False, index=True)
+    team_name: Optional[str] = Field(default=None, index=True)
+    user_country: Optional[str] = Field(default=None, index=True)
+
+
+class GroupScore(SQLModel, table=True):
+    # incrementally maintained total per team / country, keyed by ScoreGroups
+    kind: str = Field(primary_key=True, nullable=False)
+    name: str = Field(primary_key=True, nullable=False)
+    score: int = Field(default=0, nullable=False)
+
+
+class GroupScoreDelta(SQLModel, table=True):
+    # group score changes appended by writers and folded into GroupScore in the background, so writers of
+    # the same team / country never wait on one row lock
+    id: Optional[int] = Field(default=None, primary_key=True, nullable=False, sa_type=BigInteger)
+    kind: str = Field(nullable=False)
+    name: str = Field(nullable=False)
+    score: int = Field(nullable=False)
+
+
+# endregion
+
+
+# region Catalog versions
+class CatalogVersion(SQLModel, table=True):
+    # bumped on every write to a catalog table (keyed by Tables) so in-process snapshots know when to reload
+    name: str = Field(primary_key=True, nullable=False)
+    version: int = Field(default=0, nullable=False)
+
+
+# endregion
+
+
+# region User data versions
+class UserDataVersion(SQLModel, table=True):
+    # bumped with every tracking write of the user, score responses are validated against it
+    user_id: uuid.UUID = Field(primary_key=True, nullable=False)
+    version: int = Field(default=0, nullable=False, sa_type=BigInteger)
+    changed_at: Optional[datetime] = Field(default=None, nullable=False, sa_column_kwargs=SERVER_NOW)
+
+
+# endregion
+
+
+# region Redemptions
+class RedemptionBase(SQLModel):
+    user_id: uuid.UUID = Field(nullable=False, index=True)
+    # no foreign key, the ledger outlives rewards that are removed from the catalog
+    reward_id: uuid.UUID = Field(nullable=False)
+    points: int = Field(nullable=False)
+
+
+class Redemption(RedemptionBase, table=True):
+    # append-only ledger of spent points, stored on the shard of the user
+    id: Optional[uuid.UUID] = Field(default=None, primary_key=True, nullable=False, sa_column_kwargs=SERVER_UUID)
+    redeemed_at: Optional[datetime] = Field(default=None, nullable=False, sa_column_kwargs=SERVER_NOW)
+
+
+class RedemptionRead(RedemptionBase):
+    id: uuid.UUID
+    redeemed_at: datetime
+
+
+class UserBalance(SQLModel, table=True):
+    # points spent per user, the balance is UserScore.score minus spent; a table of its own because
+    # reconciliation rebuilds UserScore. version guards the optimistic update of a redemption
+    user_id: uuid.UUID = Field(primary_key=True, nullable=False)
+    spent: int = Field(default=0, nullable=False, sa_type=BigInteger)
+    version: int = Field(default=0, nullable=False, sa_type=BigInteger)
+
+
+# endregion
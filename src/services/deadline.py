@@ -0,0 +1,130 @@
+import math
+import struct
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import Engine, event
+from sqlalchemy.orm import Session
+
+from src.logging import logger
+
+# postgres sqlstate for "canceling statement due to statement timeout / user request"
+QUERY_CANCELED = "57014"
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    """Time budget of one request, shared by every database connection the request checks out."""
+
+    def __init__(self, seconds: float | None) -> None:
+        self.started_at = time.monotonic()
+        self.expires_at = math.inf
+        self.timed_out = False
+        self.cancelled = False
+        self._backends: dict[int, tuple[Engine, int]] = {}
+        self._lock = threading.Lock()
+        self.set_seconds(seconds)
+
+    def set_seconds(self, seconds: float | None) -> None:
+        self.expires_at = math.inf if seconds is None else self.started_at + seconds
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def check(self) -> None:
+        if self.cancelled:
+            raise DeadlineExceeded("Request was cancelled")
+        if self.remaining <= 0:
+            self.timed_out = True
+            raise DeadlineExceeded("Request deadline exceeded")
+
+    def attach(self, key: int, engine: Engine, pid: int) -> None:
+        with self._lock:
+            self._backends[key] = (engine, pid)
+
+    def detach(self, key: int) -> None:
+        with self._lock:
+            self._backends.pop(key, None)
+
+    def cancel_backends(self) -> None:
+        # blocking, call from a worker thread; cancels whatever the request's connections are running right now
+        with self._lock:
+            backends = list(self._backends.values())
+        for engine, pid in backends:
+            try:
+                _cancel_backend(engine, pid)
+            except Exception as e:
+                logger.warning(f"cancelling backend {pid} of {engine.url.database} failed: {e}")
+
+
+def _cancel_backend(engine: Engine, pid: int) -> None:
+    # a dedicated connection outside the pool: the request's pool may be the one that is starved, and the
+    # engine's events (deadline check, circuit breaker) must not see or block the cancel
+    cargs, cparams = engine.dialect.create_connect_args(engine.url)
+    dbapi_connection = engine.dialect.connect(*cargs, **cparams)
+    try:
+        cursor = dbapi_connection.cursor()
+        cursor.execute("SELECT pg_cancel_backend(%s)", (pid,))
+        cursor.close()
+    finally:
+        dbapi_connection.close()
+
+
+current_deadline: ContextVar[Deadline | None] = ContextVar("current_deadline", default=None)
+
+
+def _backend_pid(dbapi_connection) -> int | None:
+    # pg8000 keeps the BackendKeyData message (pid, secret) from the startup handshake
+    key_data = getattr(dbapi_connection, "_backend_key_data", None)
+    return struct.unpack("!i", key_data[:4])[0] if key_data else None
+
+
+@event.listens_for(Session, "after_begin")
+def _set_statement_timeout(session, transaction, connection):
+    deadline = current_deadline.get()
+    if deadline is None or deadline.expires_at == math.inf:
+        return
+    deadline.check()
+    # scoped to the transaction, the pooled connection goes back without a lingering timeout
+    connection.exec_driver_sql(f"SET LOCAL statement_timeout = {max(1, int(deadline.remaining * 1000))}")
+
+
+def enable_deadlines(engine: Engine, cancel_backends: bool = True) -> None:
+    if cancel_backends:
+        # behind a pooler the pid is the pooler's and not the backend's, there only statement_timeout applies
+        @event.listens_for(engine, "checkout")
+        def on_checkout(dbapi_connection, connection_record, connection_proxy):
+            deadline = current_deadline.get()
+            pid = _backend_pid(dbapi_connection)
+            if deadline is not None and pid is not None:
+                deadline.attach(id(dbapi_connection), engine, pid)
+                connection_record.info["deadline"] = deadline
+
+        @event.listens_for(engine, "checkin")
+        def on_checkin(dbapi_connection, connection_record):
+            deadline = connection_record.info.pop("deadline", None)
+            if deadline is not None:
+                deadline.detach(id(dbapi_connection))
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        deadline = current_deadline.get()
+        if deadline is not None:
+            deadline.check()
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        deadline = current_deadline.get()
+        error = context.original_exception
+        if deadline is not None and error.args and isinstance(error.args[0], dict):
+            if error.args[0].get("C") == QUERY_CANCELED:
+                deadline.timed_out = True
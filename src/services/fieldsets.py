@@ -0,0 +1,23 @@
+from functools import lru_cache
+
+from pydantic import BaseModel, create_model
+
+
+def parse_fields(fields: str | None, model: type[BaseModel]) -> tuple[str, ...] | None:
+    # None keeps the full response model, only fields of the model can be asked for
+    if fields is None:
+        return None
+    names = tuple(dict.fromkeys(i.strip() for i in fields.split(",") if i.strip()))
+    unknown = [i for i in names if i not in model.model_fields]
+    if not names or unknown:
+        raise ValueError(f"Invalid fields {', '.join(unknown)}, expected any of {', '.join(model.model_fields)}")
+    return names
+
+
+@lru_cache(maxsize=256)
+def sparse_model(model: type[BaseModel], fields: tuple[str, ...]) -> type[BaseModel]:
+    # built once per combination of fields, so its validator and serializer are reused
+    return create_model(
+        f"{model.__name__}Fields",
+        **{name: (model.model_fields[name].annotation, ...) for name in fields},
+    )
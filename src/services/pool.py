@@ -0,0 +1,79 @@
+import threading
+import time
+from contextlib import ExitStack
+
+from sqlalchemy import Engine, event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+
+# Session.info key, set on request sessions when a transaction-mode pooler sits in front of postgres
+TRANSACTION_POOLING = "transaction_pooling"
+
+
+class PoolWaitTracker:
+    # exponentially weighted average of how long requests wait to check out a pooled connection,
+    # decaying while no checkouts happen so shedding load does not keep the average high forever
+    def __init__(self, alpha: float = 0.2, half_life: float = 1.0) -> None:
+        self.alpha = alpha
+        self.half_life = half_life
+        self._average = 0.0
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _decayed(self, now: float) -> float:
+        return self._average * 0.5 ** ((now - self._updated_at) / self.half_life)
+
+    def record(self, seconds: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._average = self.alpha * seconds + (1 - self.alpha) * self._decayed(now)
+            self._updated_at = now
+
+    @property
+    def average(self) -> float:
+        with self._lock:
+            return self._decayed(time.monotonic())
+
+
+pool_wait = PoolWaitTracker()
+
+
+class TimedQueuePool(QueuePool):
+    # set by enable_circuit_breaker
+    breaker = None
+
+    def _do_get(self):
+        if self.breaker is not None:
+            self.breaker.before()
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            if self.breaker is not None:
+                self.breaker.record_failure()
+            raise
+        finally:
+            pool_wait.record(time.perf_counter() - start)
+
+
+def limit_connect_time(engine: Engine) -> None:
+    # the timeout in connect_args bounds connecting, pg8000 leaves it on the socket afterwards; queries are
+    # bounded by statement_timeout instead, so a long import or reconciliation is not cut off mid-read
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        dbapi_connection._usock.settimeout(None)
+
+
+def warm_pool(engine: Engine, connections: int) -> None:
+    # open and return connections up front so the first requests after a cold start skip connect + auth
+    with ExitStack() as stack:
+        for _ in range(connections):
+            stack.enter_context(engine.connect())
+
+
+def release_connection(session: Session) -> None:
+    # behind a transaction-mode pooler a server connection is pinned for as long as a transaction is open;
+    # end the read transaction so it goes back to the pooler while the request does other work
+    if session.info.get(TRANSACTION_POOLING) and session.in_transaction():
+        session.commit()
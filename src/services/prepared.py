@@ -0,0 +1,44 @@
+from collections import OrderedDict
+
+from pg8000.converters import make_params
+from sqlalchemy import Engine, event
+
+# statements opt in with .execution_options(prepare=True), everything else keeps pg8000's unnamed statements
+PREPARE_OPTION = "prepare"
+
+
+def _install(dbapi_connection, max_statements: int) -> None:
+    # pg8000 parses every statement as an unnamed statement; for opted-in statements parse once per
+    # connection into a named server-side statement and only send BIND/EXECUTE afterwards
+    execute_unnamed = dbapi_connection.execute_unnamed
+    prepared: OrderedDict = OrderedDict()
+    dbapi_connection._prepare_next = False
+
+    def execute(statement, vals=(), oids=(), stream=None):
+        if not dbapi_connection._prepare_next or stream is not None:
+            return execute_unnamed(statement, vals=vals, oids=oids, stream=stream)
+        dbapi_connection._prepare_next = False
+        key = (statement, tuple(oids or ()))
+        if key in prepared:
+            prepared.move_to_end(key)
+        else:
+            prepared[key] = dbapi_connection.prepare_statement(statement, oids)
+            if len(prepared) > max_statements:
+                _, (evicted, _, _) = prepared.popitem(last=False)
+                dbapi_connection.close_prepared_statement(evicted)
+        name, columns, input_funcs = prepared[key]
+        params = make_params(dbapi_connection.py_types, vals)
+        return dbapi_connection.execute_named(name, params, columns, input_funcs, statement)
+
+    dbapi_connection.execute_unnamed = execute
+
+
+def enable_prepared_statements(engine: Engine, max_statements: int = 100) -> None:
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        _install(dbapi_connection, max_statements)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None and not executemany and context.execution_options.get(PREPARE_OPTION):
+            conn.connection.dbapi_connection._prepare_next = True
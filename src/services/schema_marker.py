@@ -0,0 +1,38 @@
+from datetime import UTC, datetime
+
+from sqlalchemy import Engine
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.orm import registry
+from sqlmodel import Field, Session, SQLModel, select
+
+
+class SchemaMarker(SQLModel, registry=registry(), table=True):
+    # one row per database recording which SCHEMA_VERSION its tables were last created for
+    __tablename__ = "schema_marker"
+
+    name: str = Field(primary_key=True, nullable=False)
+    version: int = Field(nullable=False)
+    applied_at: datetime = Field(nullable=False)
+
+
+def schema_is_current(engine: Engine, name: str, version: int) -> bool:
+    try:
+        with Session(engine) as session:
+            applied = session.exec(select(SchemaMarker.version).where(SchemaMarker.name == name)).one_or_none()
+    except ProgrammingError:
+        return False
+    return applied == version
+
+
+def mark_schema_current(engine: Engine, name: str, version: int) -> None:
+    SchemaMarker.metadata.create_all(engine, checkfirst=True)
+    statement = pg_insert(SchemaMarker).values(name=name, version=version, applied_at=datetime.now(UTC))
+    with Session(engine) as session:
+        session.exec(
+            statement.on_conflict_do_update(
+                index_elements=[SchemaMarker.name],
+                set_={"version": statement.excluded.version, "applied_at": statement.excluded.applied_at},
+            )
+        )
+        session.commit()
@@ -1,25 +1,72 @@
+from functools import lru_cache
 from typing import Annotated
 
 from fastapi import Depends
+from sqlalchemy import Engine
+from sqlalchemy import text
 from sqlmodel import create_engine
 
-from src.services.user_database.tables import User
+from src.logging import logger
+from src.services.breaker import enable_circuit_breaker
+from src.services.deadline import enable_deadlines
+from src.services.pool import TimedQueuePool, limit_connect_time
+from src.services.schema_marker import mark_schema_current, schema_is_current
+from src.services.data_database.engine import DatabaseEngine as DataDatabaseEngine
+from src.services.user_database.tables import SCHEMA_VERSION, USERS_SCHEMA, User
 from src.settings import Settings, get_settings
 
 
 async def init_user_db(settings: Annotated[Settings, Depends(get_settings)]) -> None:
+    engine = DatabaseEngine(settings).engine
+    if settings.colocated_databases:
+        with engine.begin() as conn:
+            conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{settings.users_schema}"'))
+    if settings.skip_current_schema and schema_is_current(engine, name="users", version=SCHEMA_VERSION):
+        logger.info("users schema is current, skipping create_all")
+        return
+    User.metadata.create_all(engine)
+    mark_schema_current(engine, name="users", version=SCHEMA_VERSION)
+
+
+# region shared engine
+@lru_cache
+def get_shared_engine(url: str, transaction_pooling: bool = False) -> Engine:
+    settings = get_settings()
+    # one pool per process, DatabaseEngine is instantiated per request by Depends
     engine = create_engine(
-        f"postgresql+pg8000://{settings.database_user}:{settings.database_password}@{settings.database_domain}/{settings.users_database_name}",
-        # f"mysql+pymysql://{settings.database_user}:{settings.database_password}@{settings.database_domain}/{settings.users_database_name}",
+        url,
+        poolclass=TimedQueuePool,
+        pool_size=10,
+        max_overflow=10,
         echo=False,
+        pool_recycle=3600,
+        # the users database keeps its tables in the default schema
+        execution_options={"schema_translate_map": {USERS_SCHEMA: None}},
+        # a refused or unreachable database fails the connect quickly and counts against the breaker
+        connect_args={"timeout": settings.database_connect_timeout_seconds},
     )
-    User.metadata.create_all(engine)
+    limit_connect_time(engine)
+    enable_deadlines(engine, cancel_backends=not transaction_pooling)
+    enable_circuit_breaker(
+        engine,
+        name=engine.url.database,
+        failure_threshold=settings.circuit_failure_threshold,
+        reset_timeout=settings.circuit_reset_seconds,
+    )
+    return engine
 
 
 class DatabaseEngine:
     def __init__(self, settings: Annotated[Settings, Depends(get_settings)]) -> None:
-        self.engine = create_engine(
+        if settings.colocated_databases:
+            # one engine and pool for both table sets, sessions on it can join users and data in SQL
+            self.engine = DataDatabaseEngine(settings).engine
+            return
+        self.engine = get_shared_engine(
             f"postgresql+pg8000://{settings.database_user}:{settings.database_password}@{settings.database_domain}/{settings.users_database_name}",
             # f"mysql+pymysql://{settings.database_user}:{settings.database_password}@{settings.database_domain}/{settings.users_database_name}",
-            echo=False,
+            transaction_pooling=settings.transaction_pooling,
         )
+
+
+# endregion
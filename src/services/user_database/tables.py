@@ -6,6 +6,13 @@ from sqlmodel import Field, SQLModel
 
 from src.enums.Roles import Roles
 
+# bump whenever tables change so startup runs create_all again instead of trusting the schema marker
+SCHEMA_VERSION = 1
+
+# symbolic schema of the user tables, mapped by the engine's schema_translate_map to the default schema of the
+# users database, or to Settings.users_schema when users and data share one database
+USERS_SCHEMA = "users"
+
 
 class UserBase(SQLModel, registry=registry()):
     username: str = Field(index=True, unique=True)
@@ -17,6 +24,8 @@ class UserBase(SQLModel, registry=registry()):
 
 
 class User(UserBase, table=True):
+    __table_args__ = {"schema": USERS_SCHEMA}
+
     id: Optional[uuid.UUID] = Field(default_factory=uuid.uuid4, primary_key=True, nullable=False)
     role: Roles = Field(default=Roles.User.value)
     hashed_password: str = Field()
@@ -2,6 +2,8 @@ from functools import lru_cache
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+from src.enums.CountStrategies import CountStrategies
+
 
 class Settings(BaseSettings):
     database_domain: str
@@ -12,6 +14,62 @@ class Settings(BaseSettings):
     secret_key: str
     algorithm: str
     access_token_expire_minutes: int
+    tracking_delete_chunk_size: int = 10_000
+    tracking_partition_months_ahead: int = 3
+    tracking_retention_months: int | None = None
+    tracking_retention_drop: bool = False
+    score_reconcile_interval_seconds: int | None = 3600
+    group_score_fold_interval_seconds: float = 5.0
+    catalog_sync_interval_seconds: float | None = 300.0
+    rate_limit_backend: str = "memory"
+    rate_limit_redis_url: str | None = None
+    rate_limit_user_capacity: int = 60
+    rate_limit_user_refill_per_second: float = 1.0
+    rate_limit_login_capacity: int = 10
+    rate_limit_login_refill_per_second: float = 0.2
+    rate_limit_trusted_proxy_hops: int = 0
+    admission_max_concurrency: int = 100
+    admission_queue_timeout_seconds: float = 1.0
+    admission_pool_wait_threshold_seconds: float = 0.5
+    admission_retry_after_seconds: int = 2
+    prepared_statements: bool = True
+    tracking_group_commit: bool = False
+    tracking_group_commit_max_batch_size: int = 100
+    tracking_group_commit_max_delay_ms: float = 5.0
+    skip_current_schema: bool = True
+    pool_warmup_connections: int = 2
+    static_openapi: bool = False
+    activity_snapshot_check_interval_seconds: float = 5.0
+    score_batch_max_users: int = 200
+    request_deadline_seconds: float | None = 10.0
+    route_deadlines: dict[str, float] = {}
+    profiling_interval_seconds: float = 0.001
+    profiling_max_profiles: int = 20
+    profiling_sample_interval_seconds: float | None = None
+    tracking_change_retention_days: int | None = 7
+    change_feed_max_wait_seconds: float = 25.0
+    change_feed_poll_interval_seconds: float = 0.5
+    count_strategies: dict[str, CountStrategies] = {"tracking": CountStrategies.Estimate}
+    count_cache_ttl_seconds: float = 30.0
+    count_estimate_exact_below: int = 10_000
+    colocated_databases: bool = False
+    users_schema: str = "users"
+    data_shard_database_names: list[str] = []
+    analytics_max_buckets: int = 366
+    analytics_hll_precision: int = 12
+    catalog_import_batch_rows: int = 5000
+    redemption_max_retries: int = 3
+    compression_encodings: list[str] = ["br", "gzip"]
+    compression_minimum_size: int = 1024
+    compression_gzip_level: int = 6
+    compression_brotli_quality: int = 4
+    response_cache_ttl_seconds: dict[str, float] = {"/data/{table}/all": 30.0, "/data/leaderboard/{group}": 5.0}
+    response_cache_max_entries: int = 256
+    transaction_pooling: bool = False
+    circuit_failure_threshold: int = 5
+    database_connect_timeout_seconds: float = 5.0
+    circuit_reset_seconds: float = 10.0
+    stale_max_seconds: float = 300.0
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
@@ -1,5 +1,7 @@
 import uuid
 from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator
 
 
 def uuid_to_str(uuid_: uuid.UUID) -> str:
@@ -12,3 +14,9 @@ def str_to_uuid(uuid_: str) -> uuid.UUID:
 
 def datetime_to_date(datetime_: datetime) -> str:
     return datetime_.date().isoformat()
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch